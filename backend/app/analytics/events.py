@@ -0,0 +1,188 @@
+"""
+Append-only engagement event log
+
+Likes, unlikes, comments, views and follows are recorded as events owned by
+the user who received them. Hot paths only append to an in-memory buffer;
+a per-worker task writes the buffer in batches.
+
+Events go to the `engagement_events` time-series collection. On servers
+without time-series support (MongoDB < 5.0) they are rolled into hourly
+bucket documents in `engagement_event_buckets` instead, each holding a count
+and the first BUCKET_MAX_EVENTS events of the hour.
+"""
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+from app.database import get_database
+from app.hashtags.service import hour_bucket
+from app.services.background import register_periodic_task
+from app.utils import get_ist_now
+
+EVENTS_COLLECTION = "engagement_events"
+BUCKETS_COLLECTION = "engagement_event_buckets"
+EVENT_KINDS = ("like", "unlike", "comment", "view", "follow")
+EVENT_RETENTION_DAYS = 90
+BUCKET_MAX_EVENTS = 500
+
+EVENT_FLUSH_INTERVAL_SECONDS = 2
+EVENT_FLUSH_BATCH_SIZE = 1000
+# Events kept in memory while the database is unreachable; oldest dropped first
+MAX_BUFFERED_EVENTS = 50000
+
+class EventLog:
+    def __init__(self):
+        self.storage: Optional[str] = None  # "timeseries" or "buckets", set at startup
+        self._pending: List[dict] = []
+        self._flush_task = None
+
+    def record(self, kind: str, owner_id: str, actor_id: str, post_id: Optional[str] = None):
+        """Queue an event; never touches the database"""
+        if actor_id == owner_id:
+            return  # Engagement with one's own posts is not analytics
+        self._pending.append({
+            "ts": get_ist_now(),
+            "meta": {"owner_id": owner_id, "kind": kind},
+            "actor_id": actor_id,
+            "post_id": post_id
+        })
+        if len(self._pending) > MAX_BUFFERED_EVENTS:
+            del self._pending[:len(self._pending) - MAX_BUFFERED_EVENTS]
+        if len(self._pending) >= EVENT_FLUSH_BATCH_SIZE and self._flush_task is None and self.storage:
+            self._flush_task = asyncio.create_task(self._flush_in_background())
+
+    async def _flush_in_background(self):
+        try:
+            await self.flush()
+        finally:
+            self._flush_task = None
+
+    async def flush(self) -> dict:
+        """Write buffered events in batches"""
+        if not self._pending or self.storage is None:
+            return {"events_written": 0}
+
+        events, self._pending = self._pending, []
+        db = get_database()
+        written = 0
+        try:
+            for start in range(0, len(events), EVENT_FLUSH_BATCH_SIZE):
+                batch = events[start:start + EVENT_FLUSH_BATCH_SIZE]
+                if self.storage == "timeseries":
+                    await db[EVENTS_COLLECTION].insert_many(batch, ordered=False)
+                else:
+                    await db[BUCKETS_COLLECTION].bulk_write(bucket_updates(batch), ordered=False)
+                written += len(batch)
+        except Exception:
+            # Requeue what was not written, ahead of newer events
+            self._pending = events[written:] + self._pending
+            raise
+
+        return {"events_written": written}
+
+    def pending_counts(self, owner_id: str, since: datetime, until: datetime) -> Dict[str, int]:
+        """Buffered (not yet written) events for a user, by kind"""
+        counts: Dict[str, int] = defaultdict(int)
+        for event in self._pending:
+            if event["meta"]["owner_id"] == owner_id and since <= event["ts"] < until:
+                counts[event["meta"]["kind"]] += 1
+        return counts
+
+def bucket_updates(events: List[dict]) -> List[UpdateOne]:
+    """Fold events into one upsert per (owner, kind, hour) bucket"""
+    buckets: Dict[tuple, List[dict]] = defaultdict(list)
+    for event in events:
+        meta = event["meta"]
+        buckets[(meta["owner_id"], meta["kind"], hour_bucket(event["ts"]))].append(event)
+
+    return [
+        UpdateOne(
+            {"owner_id": owner_id, "kind": kind, "hour": hour},
+            {
+                "$inc": {"count": len(bucket_events)},
+                "$push": {"events": {
+                    "$each": [
+                        {"ts": event["ts"], "actor_id": event["actor_id"], "post_id": event["post_id"]}
+                        for event in bucket_events
+                    ],
+                    "$slice": BUCKET_MAX_EVENTS
+                }}
+            },
+            upsert=True
+        )
+        for (owner_id, kind, hour), bucket_events in buckets.items()
+    ]
+
+event_log = EventLog()
+
+def record_event(kind: str, owner_id: str, actor_id: str, post_id: Optional[str] = None):
+    event_log.record(kind, owner_id, actor_id, post_id)
+
+async def ensure_event_storage():
+    """Create the time-series collection, or fall back to hourly buckets"""
+    db = get_database()
+    collections = await db.list_collections(filter={"name": EVENTS_COLLECTION})
+    existing = await collections.to_list(length=1)
+    if existing:
+        event_log.storage = "timeseries" if existing[0].get("type") == "timeseries" else "buckets"
+    else:
+        try:
+            await db.create_collection(
+                EVENTS_COLLECTION,
+                timeseries={"timeField": "ts", "metaField": "meta", "granularity": "minutes"},
+                expireAfterSeconds=EVENT_RETENTION_DAYS * 24 * 60 * 60
+            )
+            event_log.storage = "timeseries"
+        except OperationFailure as e:
+            print(f"Time-series collections unavailable ({e}); using hourly event buckets")
+            event_log.storage = "buckets"
+
+    if event_log.storage == "timeseries":
+        await db[EVENTS_COLLECTION].create_index([("meta.owner_id", 1), ("meta.kind", 1), ("ts", -1)])
+    else:
+        await db[BUCKETS_COLLECTION].create_index([("owner_id", 1), ("kind", 1), ("hour", 1)], unique=True)
+        await db[BUCKETS_COLLECTION].create_index(
+            [("hour", 1)], expireAfterSeconds=EVENT_RETENTION_DAYS * 24 * 60 * 60
+        )
+
+async def count_events(owner_id: str, since: datetime, until: datetime) -> Dict[str, int]:
+    """Events received by a user between two instants, by kind"""
+    db = get_database()
+    if event_log.storage == "timeseries":
+        pipeline = [
+            {"$match": {"meta.owner_id": owner_id, "ts": {"$gte": since, "$lt": until}}},
+            {"$group": {"_id": "$meta.kind", "count": {"$sum": 1}}}
+        ]
+        rows = await db[EVENTS_COLLECTION].aggregate(pipeline).to_list(length=len(EVENT_KINDS))
+    else:
+        # Hour buckets: each bucket counts toward the window its hour starts in
+        pipeline = [
+            {"$match": {"owner_id": owner_id, "hour": {"$gte": since, "$lt": until}}},
+            {"$group": {"_id": "$kind", "count": {"$sum": "$count"}}}
+        ]
+        rows = await db[BUCKETS_COLLECTION].aggregate(pipeline).to_list(length=len(EVENT_KINDS))
+
+    counts = {kind: 0 for kind in EVENT_KINDS}
+    counts.update({row["_id"]: row["count"] for row in rows})
+    for kind, count in event_log.pending_counts(owner_id, since, until).items():
+        counts[kind] += count
+    return counts
+
+async def engagement_windows(owner_id: str, hours: int) -> dict:
+    """Counts for the last `hours` hours and the window before it"""
+    now = datetime.now(timezone.utc)
+    window = timedelta(hours=hours)
+    current = await count_events(owner_id, now - window, now)
+    previous = await count_events(owner_id, now - 2 * window, now - window)
+    return {"current": current, "previous": previous}
+
+event_flush_task = register_periodic_task(
+    "engagement_event_flush",
+    EVENT_FLUSH_INTERVAL_SECONDS,
+    event_log.flush,
+    initial_delay=EVENT_FLUSH_INTERVAL_SECONDS,
+    use_lock=False,
+    run_on_shutdown=True
+)
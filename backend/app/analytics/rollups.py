@@ -0,0 +1,150 @@
+"""
+Per-author analytics rollups maintained by the post, like, comment and view
+write paths
+
+`author_daily_stats` holds one row per author per IST day, keyed
+"<author_id>:<YYYY-MM-DD>" so an author's date range is a range scan on
+_id. Each row counts engagement received that day (gross, not reduced by
+later unlikes or deletions). Lifetime totals live on the user document
+and back both the dashboard and /analytics/users/{user_id}/stats.
+
+Both are updated through write-behind counter buffers, so the hot paths
+add no database writes of their own. The lifetime totals are also checked
+by the counter reconciler against the sums of the authors' post counters.
+"""
+from datetime import timedelta
+from typing import List
+from pymongo import UpdateOne
+from app.database import get_database
+from app.services.background import backfill_completed, mark_backfill_completed, register_periodic_task
+from app.services.counter_reconciler import RECONCILED_COUNTERS, CounterSpec
+from app.services.counters import CounterBuffer
+from app.utils import get_ist_now
+
+ROLLUP_FLUSH_INTERVAL_SECONDS = 2
+DASHBOARD_DAYS = 30
+TOTALS_BACKFILL_BATCH_SIZE = 200
+TOTALS_BACKFILL_INTERVAL_SECONDS = 10 * 60
+
+# Engagement kind -> lifetime total field on the user document
+TOTAL_FIELDS = {
+    "likes": "total_likes_received",
+    "comments": "total_comments_received",
+    "views": "total_views_received"
+}
+
+# An increment still buffered in some worker when its user is checked gets
+# counted twice once flushed; the next pass takes it back out
+RECONCILED_COUNTERS["users"].extend(
+    CounterSpec(field, "posts", "author_id", sum_field=f"{kind}_count")
+    for kind, field in TOTAL_FIELDS.items()
+)
+
+author_daily_counter = CounterBuffer("author_daily_stats", upsert=True)
+author_totals_counter = CounterBuffer("users")
+
+def day_key(day=None) -> str:
+    return (day or get_ist_now()).strftime("%Y-%m-%d")
+
+def daily_row_id(author_id: str, day=None) -> str:
+    return f"{author_id}:{day_key(day)}"
+
+def recent_day_keys(days: int = DASHBOARD_DAYS) -> List[str]:
+    """Day keys for the last `days` days, oldest first"""
+    today = get_ist_now()
+    return [day_key(today - timedelta(days=offset)) for offset in range(days - 1, -1, -1)]
+
+def record_post_created(author_id: str):
+    author_daily_counter.increment(daily_row_id(author_id), "posts")
+
+def record_engagement(author_id: str, kind: str, amount: int = 1):
+    """A like, comment or view received on one of the author's posts"""
+    author_daily_counter.increment(daily_row_id(author_id), kind, amount)
+    author_totals_counter.increment(author_id, TOTAL_FIELDS[kind], amount)
+
+def record_engagement_removed(author_id: str, kind: str, amount: int = 1):
+    """An unlike or comment deletion; only the lifetime total goes down"""
+    if amount:
+        author_totals_counter.increment(author_id, TOTAL_FIELDS[kind], -amount)
+
+def record_post_deleted(post: dict):
+    """Take a deleted post's engagement out of its author's lifetime totals"""
+    for kind in TOTAL_FIELDS:
+        record_engagement_removed(post["author_id"], kind, post.get(f"{kind}_count", 0))
+
+def pending_totals(author_id: str) -> dict:
+    """Lifetime total increments not yet flushed"""
+    return {
+        field: author_totals_counter.pending_delta(author_id, field)
+        for field in TOTAL_FIELDS.values()
+    }
+
+async def flush_rollups():
+    daily = await author_daily_counter.flush()
+    totals = await author_totals_counter.flush()
+    return {
+        "daily_rows_updated": daily["documents_updated"],
+        "authors_updated": totals["documents_updated"]
+    }
+
+async def backfill_author_totals():
+    """Seed lifetime totals for users created before they were maintained.
+    
+    Registration sets the marker, so once a run finds no unmarked users the
+    backfill is recorded as complete and later runs skip the users scan.
+    """
+    if await backfill_completed("author_totals"):
+        return {"authors_backfilled": 0}
+    
+    db = get_database()
+    backfilled = 0
+    while True:
+        cursor = db.users.find(
+            {"engagement_totals_at": {"$exists": False}}, {"_id": 1}
+        ).limit(TOTALS_BACKFILL_BATCH_SIZE)
+        author_ids = [user["_id"] async for user in cursor]
+        if not author_ids:
+            break
+
+        pipeline = [
+            {"$match": {"author_id": {"$in": author_ids}}},
+            {"$group": {
+                "_id": "$author_id",
+                "likes": {"$sum": "$likes_count"},
+                "comments": {"$sum": "$comments_count"},
+                "views": {"$sum": "$views_count"}
+            }}
+        ]
+        sums = {row["_id"]: row async for row in db.posts.aggregate(pipeline)}
+
+        now = get_ist_now()
+        await db.users.bulk_write([
+            UpdateOne({"_id": author_id}, {"$set": {
+                **{field: sums.get(author_id, {}).get(kind, 0) for kind, field in TOTAL_FIELDS.items()},
+                "engagement_totals_at": now
+            }})
+            for author_id in author_ids
+        ], ordered=False)
+        backfilled += len(author_ids)
+
+        if len(author_ids) < TOTALS_BACKFILL_BATCH_SIZE:
+            break
+
+    await mark_backfill_completed("author_totals")
+    return {"authors_backfilled": backfilled}
+
+rollup_flush_task = register_periodic_task(
+    "analytics_rollup_flush",
+    ROLLUP_FLUSH_INTERVAL_SECONDS,
+    flush_rollups,
+    initial_delay=ROLLUP_FLUSH_INTERVAL_SECONDS,
+    use_lock=False,
+    run_on_shutdown=True
+)
+
+author_totals_backfill_task = register_periodic_task(
+    "author_totals_backfill",
+    TOTALS_BACKFILL_INTERVAL_SECONDS,
+    backfill_author_totals,
+    initial_delay=45
+)
@@ -1,4 +1,6 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Query
+from app.analytics.events import EVENT_KINDS, engagement_windows
+from app.analytics.rollups import DASHBOARD_DAYS, TOTAL_FIELDS, pending_totals, recent_day_keys
 from app.database import get_database
 from app.utils import get_ist_now
 from app.auth.dependencies import get_current_user
@@ -7,6 +9,21 @@ from typing import List, Dict, Any, Optional
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
+# Advanced search counts matches only up to this many, and pages no deeper
+SEARCH_COUNT_LIMIT = 10000
+SEARCH_MAX_SKIP = 1000
+
+USER_STATS_PROJECTION = {
+    "username": 1,
+    "posts_count": 1,
+    "followers_count": 1,
+    "following_count": 1,
+    "total_likes_received": 1,
+    "total_comments_received": 1,
+    "total_views_received": 1,
+    "created_at": 1
+}
+
 @router.get("/trending")
 async def get_trending_posts(limit: int = 10) -> List[Dict[str, Any]]:
     """Get trending posts from the last 7 days ordered by likes count"""
@@ -36,34 +53,29 @@ async def get_trending_posts(limit: int = 10) -> List[Dict[str, Any]]:
     return posts
 
 @router.get("/users/{user_id}/stats")
-async def get_user_stats(user_id: str) -> Dict[str, Any]:
+async def get_user_stats(
+    user_id: str,
+    current_user: dict = Depends(get_current_user)
+) -> Dict[str, Any]:
     """Get user statistics"""
     db = get_database()
     
-    # Get user
-    user = await db.users.find_one({"_id": user_id})
+    # Every figure is a counter on the user document
+    user = await db.users.find_one({"_id": user_id}, USER_STATS_PROJECTION)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    # Get total likes on user's posts
-    pipeline = [
-        {"$match": {"author_id": user_id}},
-        {"$group": {"_id": None, "total_likes": {"$sum": "$likes_count"}}}
-    ]
-    
-    result = await db.posts.aggregate(pipeline).to_list(length=1)
-    total_likes = result[0]["total_likes"] if result else 0
-    
+    pending = pending_totals(user_id)
     return {
         "user_id": user_id,
         "username": user["username"],
-        "posts_count": user["posts_count"],
-        "followers_count": user["followers_count"],
-        "following_count": user["following_count"],
-        "total_likes_received": total_likes,
+        "posts_count": user.get("posts_count", 0),
+        "followers_count": user.get("followers_count", 0),
+        "following_count": user.get("following_count", 0),
+        **{field: user.get(field, 0) + pending[field] for field in TOTAL_FIELDS.values()},
         "created_at": user["created_at"]
     }
 
@@ -73,50 +85,43 @@ async def get_analytics_dashboard(
 ) -> Dict[str, Any]:
     """Get comprehensive analytics dashboard for current user"""
     db = get_database()
-    user_id = current_user["uid"]
+    user_id = current_user["_id"]
     
-    # Get user's posts
-    posts = await db.posts.find({"author_id": user_id}).to_list(length=None)
-    
-    # Calculate engagement metrics
-    total_posts = len(posts)
-    total_likes = sum(post.get("likes_count", 0) for post in posts)
-    total_comments = sum(post.get("comments_count", 0) for post in posts)
-    total_views = sum(post.get("views_count", 0) for post in posts)
-    
-    # Get follower/following counts
-    user = await db.users.find_one({"_id": user_id})
-    followers_count = user.get("followers_count", 0) if user else 0
-    following_count = user.get("following_count", 0) if user else 0
+    # Lifetime totals are maintained on the user document
+    pending = pending_totals(user_id)
+    total_likes = current_user.get("total_likes_received", 0) + pending["total_likes_received"]
+    total_comments = current_user.get("total_comments_received", 0) + pending["total_comments_received"]
+    total_views = current_user.get("total_views_received", 0) + pending["total_views_received"]
     
     # Calculate engagement rate
     engagement_rate = 0
     if total_views > 0:
         engagement_rate = ((total_likes + total_comments) / total_views) * 100
     
-    # Get posts by date (last 30 days)
-    thirty_days_ago = get_ist_now() - timedelta(days=30)
-    posts_by_date = {}
+    # Daily rollup rows for the last 30 days: one _id range scan
+    day_keys = recent_day_keys(DASHBOARD_DAYS)
+    rows_cursor = db.author_daily_stats.find({
+        "_id": {"$gte": f"{user_id}:{day_keys[0]}", "$lte": f"{user_id}:{day_keys[-1]}"}
+    })
+    rows = {row["_id"].rsplit(":", 1)[1]: row async for row in rows_cursor}
     
-    for post in posts:
-        post_date = post.get("created_at")
-        if post_date and post_date >= thirty_days_ago:
-            date_key = post_date.strftime("%Y-%m-%d")
-            if date_key not in posts_by_date:
-                posts_by_date[date_key] = {
-                    "date": date_key,
-                    "posts": 0,
-                    "likes": 0,
-                    "comments": 0,
-                    "views": 0
-                }
-            posts_by_date[date_key]["posts"] += 1
-            posts_by_date[date_key]["likes"] += post.get("likes_count", 0)
-            posts_by_date[date_key]["comments"] += post.get("comments_count", 0)
-            posts_by_date[date_key]["views"] += post.get("views_count", 0)
+    posts_by_date = [
+        {
+            "date": day,
+            "posts": rows[day].get("posts", 0),
+            "likes": rows[day].get("likes", 0),
+            "comments": rows[day].get("comments", 0),
+            "views": rows[day].get("views", 0)
+        }
+        for day in day_keys
+        if day in rows
+    ]
     
-    # Get top performing posts
-    top_posts = sorted(posts, key=lambda x: x.get("likes_count", 0), reverse=True)[:5]
+    # Get top performing posts from the (author_id, likes_count) index
+    top_posts = await db.posts.find(
+        {"author_id": user_id},
+        {"content": 1, "media_url": 1, "likes_count": 1, "comments_count": 1, "views_count": 1, "created_at": 1}
+    ).sort("likes_count", -1).limit(5).to_list(length=5)
     top_posts_data = [
         {
             "id": str(post.get("_id")),
@@ -135,15 +140,9 @@ async def get_analytics_dashboard(
         {"recipient_id": user_id}
     ).sort("created_at", -1).limit(10).to_list(length=10)
     
-    # Calculate growth metrics (compare last 7 days vs previous 7 days)
-    seven_days_ago = get_ist_now() - timedelta(days=7)
-    fourteen_days_ago = get_ist_now() - timedelta(days=14)
-    
-    recent_posts = [p for p in posts if p.get("created_at") and p.get("created_at") >= seven_days_ago]
-    previous_posts = [p for p in posts if p.get("created_at") and fourteen_days_ago <= p.get("created_at") < seven_days_ago]
-    
-    recent_likes = sum(p.get("likes_count", 0) for p in recent_posts)
-    previous_likes = sum(p.get("likes_count", 0) for p in previous_posts)
+    # Calculate growth metrics: likes received in the last 7 days vs the previous 7
+    recent_likes = sum(rows.get(day, {}).get("likes", 0) for day in day_keys[-7:])
+    previous_likes = sum(rows.get(day, {}).get("likes", 0) for day in day_keys[-14:-7])
     
     likes_growth = 0
     if previous_likes > 0:
@@ -151,16 +150,16 @@ async def get_analytics_dashboard(
     
     return {
         "overview": {
-            "total_posts": total_posts,
+            "total_posts": current_user.get("posts_count", 0),
             "total_likes": total_likes,
             "total_comments": total_comments,
             "total_views": total_views,
-            "followers_count": followers_count,
-            "following_count": following_count,
+            "followers_count": current_user.get("followers_count", 0),
+            "following_count": current_user.get("following_count", 0),
             "engagement_rate": round(engagement_rate, 2),
             "likes_growth": round(likes_growth, 2)
         },
-        "posts_by_date": list(posts_by_date.values()),
+        "posts_by_date": posts_by_date,
         "top_posts": top_posts_data,
         "recent_activity": [
             {
@@ -174,6 +173,26 @@ async def get_analytics_dashboard(
         ]
     }
 
+@router.get("/engagement")
+async def get_engagement(
+    hours: int = Query(24 * 7, ge=1, le=24 * 45),
+    current_user: dict = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """Engagement received in the last `hours` hours compared with the window before"""
+    windows = await engagement_windows(current_user["_id"], hours)
+    
+    growth = {}
+    for kind in EVENT_KINDS:
+        previous = windows["previous"][kind]
+        growth[kind] = round((windows["current"][kind] - previous) / previous * 100, 2) if previous else 0
+    
+    return {
+        "hours": hours,
+        "current": windows["current"],
+        "previous": windows["previous"],
+        "growth": growth
+    }
+
 @router.get("/search/advanced")
 async def advanced_search(
     query: Optional[str] = None,
@@ -185,23 +204,33 @@ async def advanced_search(
     date_to: Optional[str] = None,
     tags: Optional[str] = None,  # comma-separated
     author_id: Optional[str] = None,
-    sort_by: str = "created_at",  # created_at, likes_count, comments_count, views_count
-    sort_order: str = "desc",  # asc, desc
-    limit: int = 20,
-    skip: int = 0
+    sort_by: Optional[str] = Query(None, regex="^(relevance|created_at|likes_count|comments_count|views_count)$"),
+    sort_order: str = Query("desc", regex="^(asc|desc)$"),
+    limit: int = Query(20, ge=1, le=100),
+    skip: int = Query(0, ge=0, le=SEARCH_MAX_SKIP)
 ) -> Dict[str, Any]:
-    """Advanced search for posts with multiple filters"""
+    """Advanced search for posts with multiple filters
+    
+    `query` goes through the posts text index: it matches whole words in the
+    content, author username and tags (no substrings), and results default to
+    relevance order. Without a query, results default to newest first.
+    """
     db = get_database()
     
     # Build query
     search_query = {}
     
     # Text search
+    query = (query or "").strip()
     if query:
-        search_query["$or"] = [
-            {"content": {"$regex": query, "$options": "i"}},
-            {"author_username": {"$regex": query, "$options": "i"}}
-        ]
+        search_query["$text"] = {"$search": query}
+    if sort_by is None:
+        sort_by = "relevance" if query else "created_at"
+    if sort_by == "relevance" and not query:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Relevance sort requires a search query"
+        )
     
     # Media type filter
     if media_type:
@@ -247,15 +276,23 @@ async def advanced_search(
     if author_id:
         search_query["author_id"] = author_id
     
-    # Get total count
-    total = await db.posts.count_documents(search_query)
+    # Total, counted only up to a cap so broad queries stay cheap
+    total = await db.posts.count_documents(search_query, limit=SEARCH_COUNT_LIMIT)
     
-    # Sort direction
+    # Sort; _id breaks ties so pages don't overlap
     sort_direction = -1 if sort_order == "desc" else 1
-    
-    # Execute search
-    cursor = db.posts.find(search_query).sort(sort_by, sort_direction).skip(skip).limit(limit)
-    posts = await cursor.to_list(length=limit)
+    projection = None
+    if sort_by == "relevance":
+        projection = {"score": {"$meta": "textScore"}}
+        sort = [("score", {"$meta": "textScore"}), ("_id", -1)]
+    else:
+        sort = [(sort_by, sort_direction), ("_id", sort_direction)]
+    
+    # Execute search, one extra row to tell whether another page exists
+    cursor = db.posts.find(search_query, projection).sort(sort).skip(skip).limit(limit + 1)
+    posts = await cursor.to_list(length=limit + 1)
+    has_more = len(posts) > limit
+    posts = posts[:limit]
     
     # Convert ObjectId to string
     for post in posts:
@@ -264,7 +301,8 @@ async def advanced_search(
     return {
         "posts": posts,
         "total": total,
+        "total_is_capped": total >= SEARCH_COUNT_LIMIT,
         "limit": limit,
         "skip": skip,
-        "has_more": (skip + limit) < total
+        "has_more": has_more
     }
\ No newline at end of file
@@ -4,6 +4,8 @@ from app.models import UserCreate, UserLogin, Token, UserResponse
 from app.auth.dependencies import get_password_hash, verify_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
 from app.database import get_database
 from app.services.email_service import email_service
+from app.users.autocomplete import index_user
+from app.users.search import build_search_tokens
 from app.utils import get_ist_now
 from bson import ObjectId
 from pydantic import BaseModel
@@ -72,10 +74,16 @@ async def register(user: UserCreate):
         "followers_count": 0,
         "following_count": 0,
         "posts_count": 0,
+        "total_likes_received": 0,
+        "total_comments_received": 0,
+        "total_views_received": 0,
+        "engagement_totals_at": get_ist_now(),
+        "search_tokens": build_search_tokens(user.username, user.displayName),
         "created_at": get_ist_now()
     }
     
     await db.users.insert_one(user_doc)
+    index_user(user_doc)
     
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
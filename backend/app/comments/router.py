@@ -1,14 +1,65 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List
-from app.models import CommentCreate, CommentResponse
+from fastapi import APIRouter, HTTPException, status, Depends, Query
+from typing import List, Optional
+from app.analytics.events import record_event
+from app.analytics.rollups import record_engagement, record_engagement_removed
+from app.models import CommentCreate, CommentResponse, CommentsPage, CommentThreadResponse
 from app.auth.dependencies import get_current_user
 from app.database import get_database
 from app.notifications.router import create_notification
+from app.pagination import encode_cursor, keyset_filter, keyset_sort
+from app.services.background import backfill_completed, mark_backfill_completed, register_periodic_task
+from app.services.cache import SingleFlight, TTLCache
 from app.utils import get_ist_now
 from bson import ObjectId
+from pymongo import UpdateOne
+import re
 
 router = APIRouter(prefix="/comments", tags=["comments"])
 
+# Each comment stores a materialized path: its ancestors' IDs and its own,
+# joined by PATH_SEPARATOR, plus its depth (0 for top-level comments).
+# Comment IDs are fixed-length ObjectId strings, so sorting a post's comments
+# by path lists every thread depth-first with replies in posting order.
+PATH_SEPARATOR = "."
+MAX_THREAD_DEPTH = 5
+# Upper bound on comments read for one thread request
+MAX_THREAD_NODES = 500
+PATH_BACKFILL_BATCH_SIZE = 500
+PATH_BACKFILL_INTERVAL_SECONDS = 60 * 60
+
+# Deleted comments are hidden at once (deleted_at set on the whole subtree)
+# and removed later by the purge job
+PURGE_BATCH_SIZE = 500
+PURGE_BATCHES_PER_RUN = 20
+PURGE_INTERVAL_SECONDS = 60
+
+COMMENT_PAGE_MAX = 50
+
+# First page of top-level comments per post. Hot posts are read far more
+# often than they are commented on; writes in this worker invalidate the
+# entry and the TTL bounds staleness from writes in other workers.
+first_page_cache = TTLCache(ttl_seconds=5, max_entries=2000)
+first_page_flight = SingleFlight()
+
+async def comment_path(db, comment: dict) -> str:
+    """Path of an existing comment, computing and storing it for comments
+    created before paths existed"""
+    if comment.get("path"):
+        return comment["path"]
+    
+    if comment.get("parent_id"):
+        parent = await db.comments.find_one({"_id": comment["parent_id"]}, {"path": 1, "parent_id": 1})
+        parent_path = await comment_path(db, parent) if parent else comment["parent_id"]
+        path = f"{parent_path}{PATH_SEPARATOR}{comment['_id']}"
+    else:
+        path = comment["_id"]
+    
+    await db.comments.update_one(
+        {"_id": comment["_id"]},
+        {"$set": {"path": path, "depth": path.count(PATH_SEPARATOR)}}
+    )
+    return path
+
 @router.post("/posts/{post_id}", response_model=CommentResponse)
 async def add_comment(
     post_id: str,
@@ -27,6 +78,19 @@ async def add_comment(
         )
     
     comment_id = str(ObjectId())
+    path = comment_id
+    if comment.parent_id:
+        parent = await db.comments.find_one(
+            {"_id": comment.parent_id, "post_id": post_id, "deleted_at": None},
+            {"path": 1, "parent_id": 1}
+        )
+        if not parent:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Parent comment not found"
+            )
+        path = f"{await comment_path(db, parent)}{PATH_SEPARATOR}{comment_id}"
+    
     comment_doc = {
         "_id": comment_id,
         "post_id": post_id,
@@ -36,12 +100,15 @@ async def add_comment(
         "author_photo": current_user.get("photoURL"),
         "content": comment.content,
         "parent_id": comment.parent_id,  # Support nested comments
+        "path": path,
+        "depth": path.count(PATH_SEPARATOR),
         "replies_count": 0,
         "created_at": get_ist_now(),
         "updated_at": None
     }
     
     await db.comments.insert_one(comment_doc)
+    invalidate_first_page(post_id)
     
     # If this is a reply, update parent comment's reply count
     if comment.parent_id:
@@ -55,6 +122,8 @@ async def add_comment(
         {"_id": post_id},
         {"$inc": {"comments_count": 1}}
     )
+    record_engagement(post["author_id"], "comments")
+    record_event("comment", post["author_id"], current_user["_id"], post_id)
     
     # Create notification for post author
     await create_notification(
@@ -68,38 +137,125 @@ async def add_comment(
     
     return CommentResponse(**comment_doc)
 
-@router.get("/posts/{post_id}", response_model=List[CommentResponse])
+async def load_comments_page(query_filter: dict, cursor: Optional[str], limit: int) -> List[dict]:
+    """Up to limit + 1 comments in (created_at, _id) order after the cursor"""
+    db = get_database()
+    if cursor:
+        query_filter = {**query_filter, **keyset_filter("created_at", cursor, descending=False)}
+    comments_cursor = db.comments.find(query_filter).sort(keyset_sort("created_at", descending=False)).limit(limit + 1)
+    return await comments_cursor.to_list(length=limit + 1)
+
+def comments_page(comments: List[dict], limit: int) -> CommentsPage:
+    has_more = len(comments) > limit
+    comments = comments[:limit]
+    return CommentsPage(
+        comments=[CommentResponse(**comment) for comment in comments],
+        has_more=has_more,
+        next_cursor=encode_cursor(comments[-1]["created_at"], comments[-1]["_id"]) if has_more else None
+    )
+
+def invalidate_first_page(post_id: str):
+    """Drop the cached first page after a comment on the post changes"""
+    first_page_cache.invalidate(post_id)
+
+@router.get("/posts/{post_id}", response_model=CommentsPage)
 async def get_post_comments(
     post_id: str,
-    limit: int = 50,
-    skip: int = 0
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(COMMENT_PAGE_MAX, ge=1, le=COMMENT_PAGE_MAX),
+    current_user: dict = Depends(get_current_user)
 ):
-    """Get top-level comments for a post (not replies)"""
-    db = get_database()
-    
-    cursor = db.comments.find({
+    """Get top-level comments for a post (not replies), oldest first"""
+    query_filter = {
         "post_id": post_id,
-        "parent_id": None  # Only top-level comments
-    }).sort("created_at", 1).skip(skip).limit(limit)
+        "parent_id": None,  # Only top-level comments
+        "deleted_at": None
+    }
+    
+    if cursor:
+        comments = await load_comments_page(query_filter, cursor, limit)
+        return comments_page(comments, limit)
     
-    comments = await cursor.to_list(length=limit)
-    return [CommentResponse(**comment) for comment in comments]
+    # First page: served from cache, with concurrent misses sharing one query.
+    # The full COMMENT_PAGE_MAX page is cached and sliced for smaller limits.
+    comments = first_page_cache.get(post_id)
+    if comments is None:
+        async def load():
+            page = await load_comments_page(query_filter, None, COMMENT_PAGE_MAX)
+            first_page_cache.set(post_id, page)
+            return page
+        comments = await first_page_flight.do(post_id, load)
+    
+    return comments_page(comments[:limit + 1], limit)
 
-@router.get("/{comment_id}/replies", response_model=List[CommentResponse])
+@router.get("/{comment_id}/replies", response_model=CommentsPage)
 async def get_comment_replies(
     comment_id: str,
-    limit: int = 50,
-    skip: int = 0
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(COMMENT_PAGE_MAX, ge=1, le=COMMENT_PAGE_MAX),
+    current_user: dict = Depends(get_current_user)
 ):
-    """Get replies to a specific comment"""
+    """Get replies to a specific comment, oldest first"""
+    comments = await load_comments_page({"parent_id": comment_id, "deleted_at": None}, cursor, limit)
+    return comments_page(comments, limit)
+
+@router.get("/{comment_id}/thread", response_model=CommentThreadResponse)
+async def get_comment_thread(
+    comment_id: str,
+    depth: int = Query(3, ge=1, le=MAX_THREAD_DEPTH, description="Levels of replies below the comment"),
+    replies_limit: int = Query(10, ge=1, le=50, description="Replies returned per comment"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get a comment with the first `depth` levels of its replies in one query"""
     db = get_database()
     
+    root = await db.comments.find_one({"_id": comment_id, "deleted_at": None})
+    if not root:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Comment not found"
+        )
+    root_path = await comment_path(db, root)
+    root_depth = root_path.count(PATH_SEPARATOR)
+    
+    # Anchored prefix match on the (post_id, path) index; depth-first order
     cursor = db.comments.find({
-        "parent_id": comment_id
-    }).sort("created_at", 1).skip(skip).limit(limit)
+        "post_id": root["post_id"],
+        "path": {"$regex": f"^{re.escape(root_path + PATH_SEPARATOR)}"},
+        "depth": {"$lte": root_depth + depth},
+        "deleted_at": None
+    }).sort("path", 1).limit(MAX_THREAD_NODES)
+    
+    # Parents always precede their replies in path order, so one pass
+    # attaches each reply, keeping the first replies_limit per parent
+    nodes = {comment_id: dict(root, replies=[], has_more_replies=False)}
+    scanned = 0
+    last_comment = None
+    async for comment in cursor:
+        scanned += 1
+        last_comment = comment
+        parent = nodes.get(comment.get("parent_id"))
+        if parent is None:
+            continue  # Under a reply that was cut by replies_limit
+        if len(parent["replies"]) >= replies_limit:
+            parent["has_more_replies"] = True
+            continue
+        node = dict(comment, replies=[], has_more_replies=False)
+        parent["replies"].append(node)
+        nodes[comment["_id"]] = node
+    
+    if scanned == MAX_THREAD_NODES:
+        # The read stopped inside the subtrees of the last comment's
+        # ancestors (and its own, if deep enough to have replies shown);
+        # flag them so the client pages in the rest
+        cut_ids = last_comment["path"].split(PATH_SEPARATOR)
+        if last_comment["depth"] >= root_depth + depth:
+            cut_ids.pop()
+        for cut_id in cut_ids:
+            if cut_id in nodes:
+                nodes[cut_id]["has_more_replies"] = True
     
-    replies = await cursor.to_list(length=limit)
-    return [CommentResponse(**reply) for reply in replies]
+    return CommentThreadResponse(**nodes[comment_id])
 
 @router.put("/{comment_id}", response_model=CommentResponse)
 async def edit_comment(
@@ -110,7 +266,7 @@ async def edit_comment(
     """Edit a comment (only by author)"""
     db = get_database()
     
-    comment = await db.comments.find_one({"_id": comment_id})
+    comment = await db.comments.find_one({"_id": comment_id, "deleted_at": None})
     if not comment:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -133,6 +289,8 @@ async def edit_comment(
         }}
     )
     
+    invalidate_first_page(comment["post_id"])
+    
     # Get updated comment
     updated_comment = await db.comments.find_one({"_id": comment_id})
     return CommentResponse(**updated_comment)
@@ -145,7 +303,7 @@ async def delete_comment(
     """Delete a comment (only by author)"""
     db = get_database()
     
-    comment = await db.comments.find_one({"_id": comment_id})
+    comment = await db.comments.find_one({"_id": comment_id, "deleted_at": None})
     if not comment:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -159,8 +317,18 @@ async def delete_comment(
             detail="Not authorized to delete this comment"
         )
     
-    # Delete comment
-    await db.comments.delete_one({"_id": comment_id})
+    # Soft-delete the comment and every reply below it in one update; the
+    # purge job removes the documents in the background
+    path = await comment_path(db, comment)
+    result = await db.comments.update_many(
+        {
+            "post_id": comment["post_id"],
+            "path": {"$regex": f"^{re.escape(path)}(?:{re.escape(PATH_SEPARATOR)}|$)"},
+            "deleted_at": None
+        },
+        {"$set": {"deleted_at": get_ist_now()}}
+    )
+    invalidate_first_page(comment["post_id"])
     
     # If this was a reply, update parent comment's reply count
     if comment.get("parent_id"):
@@ -169,21 +337,110 @@ async def delete_comment(
             {"$inc": {"replies_count": -1}}
         )
     
-    # Delete all replies to this comment
-    replies = await db.comments.find({"parent_id": comment_id}).to_list(length=1000)
-    if replies:
-        reply_ids = [reply["_id"] for reply in replies]
-        await db.comments.delete_many({"_id": {"$in": reply_ids}})
-        # Adjust comment count for deleted replies
-        await db.posts.update_one(
+    # Update post comments count by the size of the deleted subtree
+    if result.modified_count:
+        post = await db.posts.find_one_and_update(
             {"_id": comment["post_id"]},
-            {"$inc": {"comments_count": -len(replies)}}
+            {"$inc": {"comments_count": -result.modified_count}},
+            projection={"author_id": 1}
         )
+        if post:
+            record_engagement_removed(post["author_id"], "comments", result.modified_count)
     
-    # Update post comments count
-    await db.posts.update_one(
-        {"_id": comment["post_id"]},
-        {"$inc": {"comments_count": -1}}
-    )
+    return {"message": "Comment deleted successfully", "deleted_count": result.modified_count}
+
+async def backfill_comment_paths():
+    """Add path and depth to comments created before materialized paths.
+    
+    New comments get a path when they are added, so once a run finds none
+    left the backfill is recorded as complete and later runs skip the scan.
+    """
+    if await backfill_completed("comment_paths"):
+        return {"comments_updated": 0}
+    
+    db = get_database()
+    updated = 0
+    while True:
+        # Parents sort before their replies, so each batch can resolve
+        # replies whose parents were filled in by an earlier batch
+        cursor = db.comments.find(
+            {"path": {"$exists": False}},
+            {"parent_id": 1, "created_at": 1}
+        ).sort("created_at", 1).limit(PATH_BACKFILL_BATCH_SIZE)
+        comments = await cursor.to_list(length=PATH_BACKFILL_BATCH_SIZE)
+        if not comments:
+            break
+        
+        parent_ids = list({comment["parent_id"] for comment in comments if comment.get("parent_id")})
+        parents_cursor = db.comments.find(
+            {"_id": {"$in": parent_ids}},
+            {"path": 1, "deleted_at": 1}
+        )
+        paths = {}
+        deleted_ids = set(parent_ids)  # Parents not found were hard-deleted
+        async for parent in parents_cursor:
+            if parent.get("path"):
+                paths[parent["_id"]] = parent["path"]
+            if not parent.get("deleted_at"):
+                deleted_ids.discard(parent["_id"])
+        
+        operations = []
+        for comment in comments:
+            if comment.get("parent_id"):
+                # A parent that no longer exists keeps its ID as the path
+                # prefix, so the orphan sits under the deleted thread
+                parent_path = paths.get(comment["parent_id"], comment["parent_id"])
+                path = f"{parent_path}{PATH_SEPARATOR}{comment['_id']}"
+            else:
+                path = comment["_id"]
+            paths[comment["_id"]] = path
+            update = {"path": path, "depth": path.count(PATH_SEPARATOR)}
+            # Replies under a thread deleted before they had a path go with
+            # it, whether the parent is soft-deleted or already purged
+            if comment.get("parent_id") in deleted_ids:
+                update["deleted_at"] = get_ist_now()
+                deleted_ids.add(comment["_id"])
+            operations.append(UpdateOne({"_id": comment["_id"]}, {"$set": update}))
+        
+        await db.comments.bulk_write(operations, ordered=False)
+        updated += len(operations)
     
-    return {"message": "Comment deleted successfully"}
\ No newline at end of file
+    await mark_backfill_completed("comment_paths")
+    return {"comments_updated": updated}
+
+async def purge_deleted_comments():
+    """Remove soft-deleted comments and their notifications in batches"""
+    # Legacy replies are only marked deleted with their parent while both
+    # exist, so nothing is purged until every comment has a path
+    if not await backfill_completed("comment_paths"):
+        return {"comments_purged": 0}
+    
+    db = get_database()
+    purged = 0
+    for _ in range(PURGE_BATCHES_PER_RUN):
+        cursor = db.comments.find({"deleted_at": {"$exists": True}}, {"_id": 1}).limit(PURGE_BATCH_SIZE)
+        comment_ids = [comment["_id"] async for comment in cursor]
+        if not comment_ids:
+            break
+        
+        await db.notifications.delete_many({"comment_id": {"$in": comment_ids}})
+        result = await db.comments.delete_many({"_id": {"$in": comment_ids}})
+        purged += result.deleted_count
+        
+        if len(comment_ids) < PURGE_BATCH_SIZE:
+            break
+    
+    return {"comments_purged": purged}
+
+comment_purge_task = register_periodic_task(
+    "comment_purge",
+    PURGE_INTERVAL_SECONDS,
+    purge_deleted_comments
+)
+
+comment_path_backfill_task = register_periodic_task(
+    "comment_path_backfill",
+    PATH_BACKFILL_INTERVAL_SECONDS,
+    backfill_comment_paths,
+    initial_delay=30
+)
@@ -1,7 +1,43 @@
 """
 Database indexes for optimal query performance
 """
+from pymongo.errors import OperationFailure
 from app.database import get_database
+from app.stories.router import STORY_TTL_GRACE_SECONDS
+from app.hashtags.service import HASHTAG_COLLATION, STATS_RETENTION_DAYS
+from app.analytics.events import ensure_event_storage
+from app.users.search import USERNAME_COLLATION
+
+async def ensure_ttl_index(collection, field: str, expire_after_seconds: int):
+    """Create a TTL index, replacing a plain index on the same field if present"""
+    try:
+        await collection.create_index([(field, 1)], expireAfterSeconds=expire_after_seconds)
+    except OperationFailure as e:
+        # IndexOptionsConflict / IndexKeySpecsConflict: an index on this key already exists
+        if e.code not in (85, 86):
+            raise
+        await collection.drop_index(f"{field}_1")
+        await collection.create_index([(field, 1)], expireAfterSeconds=expire_after_seconds)
+
+async def dedupe_pending_follow_requests(db):
+    """Keep only the oldest pending request per (requester, target) pair, so
+    the partial unique index can be built over existing data"""
+    pipeline = [
+        {"$match": {"status": "pending"}},
+        {"$sort": {"created_at": 1, "_id": 1}},
+        {"$group": {
+            "_id": {"requester_id": "$requester_id", "target_id": "$target_id"},
+            "request_ids": {"$push": "$_id"},
+            "count": {"$sum": 1}
+        }},
+        {"$match": {"count": {"$gt": 1}}}
+    ]
+    duplicate_ids = []
+    async for group in db.follow_requests.aggregate(pipeline, allowDiskUse=True):
+        duplicate_ids.extend(group["request_ids"][1:])
+    if duplicate_ids:
+        result = await db.follow_requests.delete_many({"_id": {"$in": duplicate_ids}})
+        print(f"Removed {result.deleted_count} duplicate pending follow requests")
 
 async def create_indexes():
     """Create database indexes for optimal performance"""
@@ -14,6 +50,18 @@ async def create_indexes():
     await db.posts.create_index([("views_count", -1)])  # New index for views
     await db.posts.create_index([("media_type", 1), ("created_at", -1)])
     await db.posts.create_index([("author_id", 1), ("created_at", -1)])
+    await db.posts.create_index([("author_id", 1), ("likes_count", -1)])  # Dashboard top posts
+    await db.posts.create_index(
+        [("tags", 1), ("created_at", -1), ("_id", -1)],
+        collation=HASHTAG_COLLATION,
+        name="posts_tags_pages_ci"
+    )  # Hashtag pages
+    await db.posts.create_index(
+        [("content", "text"), ("author_username", "text"), ("tags", "text")],
+        weights={"content": 1, "author_username": 3, "tags": 5},
+        default_language="none",  # Mixed-language posts: no stemming or stop words
+        name="posts_text"
+    )  # Advanced search
     
     # Post views collection indexes
     await db.post_views.create_index([("post_id", 1), ("viewer_id", 1)], unique=True)
@@ -25,34 +73,72 @@ async def create_indexes():
     
     # Comments collection indexes
     await db.comments.create_index([("post_id", 1), ("created_at", 1)])
+    await db.comments.create_index([("post_id", 1), ("parent_id", 1), ("created_at", 1), ("_id", 1)])  # Top-level comment pages
     await db.comments.create_index([("author_id", 1)])
+    await db.comments.create_index([("post_id", 1), ("path", 1)])  # Thread loading
+    await db.comments.create_index([("deleted_at", 1)], sparse=True)  # Purge of deleted comments
+    await db.comments.create_index([("parent_id", 1), ("created_at", 1), ("_id", 1)])  # Reply pages, reply count reconciliation
     
     # Follows collection indexes
     await db.follows.create_index([("follower_id", 1), ("following_id", 1)], unique=True)
-    await db.follows.create_index([("following_id", 1)])
+    await db.follows.create_index([("following_id", 1), ("created_at", -1), ("_id", -1)])  # Followers list pages
+    await db.follows.create_index([("follower_id", 1), ("created_at", -1), ("_id", -1)])  # Following list pages
+    await db.follows.create_index([("created_at", -1)])  # Follower growth leaderboard
+    
+    # Follow requests: at most one pending request per pair
+    await dedupe_pending_follow_requests(db)
+    try:
+        await db.follow_requests.create_index(
+            [("requester_id", 1), ("target_id", 1)],
+            unique=True,
+            partialFilterExpression={"status": "pending"}
+        )
+    except OperationFailure as e:
+        # A duplicate created between the dedupe and the build; the next
+        # startup removes it and retries
+        if e.code != 11000:
+            raise
+        print(f"Pending follow request index not built: {e}")
+    await db.follow_requests.create_index([("target_id", 1), ("status", 1), ("created_at", -1), ("_id", -1)])  # Request inbox pages
     
     # Users collection indexes
     await db.users.create_index([("username", 1)], unique=True)
     await db.users.create_index([("email", 1)], unique=True)
     await db.users.create_index([("followers_count", -1)])
+    await db.users.create_index([("search_tokens", 1), ("followers_count", -1)])  # Prefix search
+    await db.users.create_index(
+        [("username", 1)], collation=USERNAME_COLLATION, name="users_username_ci"
+    )  # Exact username in search
     
     # Stories collection indexes
     await db.stories.create_index([("author_id", 1), ("created_at", -1)])
-    await db.stories.create_index([("expires_at", 1)])  # For cleanup
+    await ensure_ttl_index(db.stories, "expires_at", STORY_TTL_GRACE_SECONDS)  # Expiry backstop
     
     # Story views collection indexes
     await db.story_views.create_index([("story_id", 1), ("viewer_id", 1)], unique=True)
-    await db.story_views.create_index([("story_id", 1), ("viewed_at", -1)])
+    await db.story_views.create_index([("story_id", 1), ("viewed_at", -1), ("_id", -1)])  # Viewer list pages
+    await db.story_views.create_index([("viewed_at", 1)])  # Orphaned view cleanup
+    
+    # Hashtag stats (hourly buckets) indexes
+    await db.hashtag_stats.create_index([("hashtag", 1), ("bucket", 1)], unique=True)
+    await ensure_ttl_index(db.hashtag_stats, "bucket", STATS_RETENTION_DAYS * 24 * 60 * 60)
+    
+    # Hashtag dictionary indexes (_id is the lowercase key, for prefix ranges)
+    await db.hashtags.create_index([("usage_count", -1), ("last_used_at", -1)])  # Short-prefix search, hot lists
     
     # Blocks collection indexes
     await db.blocks.create_index([("blocker_id", 1), ("blocked_id", 1)], unique=True)
     await db.blocks.create_index([("blocked_id", 1)])
+    await db.blocks.create_index([("created_at", -1)])  # Suggestion refresh
     
     # Reports collection indexes
     await db.reports.create_index([("target_type", 1), ("target_id", 1)])
     await db.reports.create_index([("status", 1), ("created_at", -1)])
     await db.reports.create_index([("reporter_id", 1)])
     
+    # Engagement events: time-series collection, or hourly buckets as fallback
+    await ensure_event_storage()
+    
     print("Database indexes created successfully!")
 
 if __name__ == "__main__":
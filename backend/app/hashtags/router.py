@@ -1,13 +1,17 @@
 from fastapi import APIRouter, Depends, Query
-from typing import List
+from typing import List, Optional
 from app.auth.dependencies import get_current_user
 from app.database import get_database
+from app.hashtags.service import get_trending, hashtag_key, hashtag_post_batches, search_hashtag_dictionary
 from app.models import PostResponse
-from app.utils import get_ist_now
-from datetime import timedelta
+from app.pagination import decode_cursor, encode_cursor
+from app.services.follow_graph import following_among
 
 router = APIRouter(prefix="/hashtags", tags=["hashtags"])
 
+# Candidate batches a hashtag page may scan before returning what it has
+MAX_SCANNED_BATCHES = 5
+
 @router.get("/trending")
 async def get_trending_hashtags(
     limit: int = Query(20, ge=1, le=50),
@@ -15,37 +19,23 @@ async def get_trending_hashtags(
     current_user: dict = Depends(get_current_user)
 ):
     """Get trending hashtags based on post count in last N days"""
-    db = get_database()
-    
-    # Calculate date range
-    since_date = get_ist_now() - timedelta(days=days)
-    
-    # Aggregate hashtags from recent posts
-    pipeline = [
-        {"$match": {"created_at": {"$gte": since_date}}},
-        {"$unwind": "$tags"},
-        {"$match": {"tags": {"$regex": "^#"}}},  # Only hashtags
-        {"$group": {
-            "_id": "$tags",
-            "count": {"$sum": 1},
-            "recent_post_ids": {"$push": "$_id"}
-        }},
-        {"$sort": {"count": -1}},
-        {"$limit": limit}
-    ]
-    
-    results = await db.posts.aggregate(pipeline).to_list(length=limit)
+    return await get_trending(days, limit)
+
+async def visible_author_ids(db, viewer_id: str, author_ids: set) -> set:
+    """Subset of authors whose posts the viewer may see (public, self, or followed)"""
+    cursor = db.users.find({"_id": {"$in": list(author_ids)}, "is_private": True}, {"_id": 1})
+    private_ids = {user["_id"] async for user in cursor} - {viewer_id}
+    if not private_ids:
+        return author_ids
     
-    return [{
-        "hashtag": result["_id"],
-        "post_count": result["count"],
-        "trending_score": result["count"]  # Can be enhanced with engagement metrics
-    } for result in results]
+    # Access control: read follows directly rather than the cached graph
+    following_ids = await following_among(viewer_id, private_ids)
+    return author_ids - (private_ids - following_ids)
 
 @router.get("/{hashtag}/posts")
 async def get_posts_by_hashtag(
     hashtag: str,
-    skip: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
     limit: int = Query(20, ge=1, le=50),
     current_user: dict = Depends(get_current_user)
 ):
@@ -56,59 +46,71 @@ async def get_posts_by_hashtag(
     if not hashtag.startswith('#'):
         hashtag = f"#{hashtag}"
     
-    # Find posts with this hashtag (fetch more than needed to account for privacy filtering)
-    cursor = db.posts.find({
-        "tags": hashtag
-    }).sort("created_at", -1).skip(skip).limit(limit * 2)
+    after = decode_cursor(cursor) if cursor else None
     
-    all_posts = await cursor.to_list(length=limit * 2)
-    
-    # Get list of users current user is following
-    following_cursor = db.follows.find({"follower_id": current_user["_id"]})
-    following_ids = [follow["following_id"] async for follow in following_cursor]
+    # Walk candidates newest first, keeping the ones the viewer may see. A
+    # tag mostly posted by hidden authors returns a short page rather than
+    # scanning the whole tag in one request.
+    selected = []
+    last_scanned = None
+    has_more = False
+    scanned_batches = 0
+    async for batch in hashtag_post_batches(hashtag, after, limit * 2):
+        if scanned_batches == MAX_SCANNED_BATCHES:
+            has_more = True
+            break
+        scanned_batches += 1
+        visible_ids = await visible_author_ids(
+            db, current_user["_id"], {entry["author_id"] for entry in batch}
+        )
+        for entry in batch:
+            if len(selected) >= limit:
+                has_more = True
+                break
+            last_scanned = entry
+            if entry["author_id"] in visible_ids:
+                selected.append(entry["post_id"])
+        if has_more:
+            break
     
-    # Filter posts based on privacy settings
-    filtered_posts = []
-    for post in all_posts:
-        # Get post author's privacy settings
-        author = await db.users.find_one({"_id": post["author_id"]})
+    # Load the selected posts and the viewer's likes/bookmarks in batches
+    posts_by_id = {}
+    liked_ids = set()
+    bookmarked_ids = set()
+    if selected:
+        posts_cursor = db.posts.find({"_id": {"$in": selected}})
+        posts_by_id = {str(post["_id"]): post async for post in posts_cursor}
         
-        # Include post if:
-        # 1. Author is not private, OR
-        # 2. Current user is the author, OR
-        # 3. Current user is following the author
-        if (not author or not author.get("is_private", False) or 
-            post["author_id"] == current_user["_id"] or 
-            post["author_id"] in following_ids):
-            
-            # Convert ObjectId to string
-            post["_id"] = str(post["_id"])
-            
-            like = await db.likes.find_one({
-                "post_id": post["_id"],
-                "user_id": current_user["_id"]
-            })
-            post["is_liked"] = like is not None
-            
-            bookmark = await db.bookmarks.find_one({
-                "post_id": post["_id"],
-                "user_id": current_user["_id"]
-            })
-            post["is_bookmarked"] = bookmark is not None
-            
-            filtered_posts.append(post)
-            
-            # Stop once we have enough posts
-            if len(filtered_posts) >= limit:
-                break
+        likes_cursor = db.likes.find(
+            {"user_id": current_user["_id"], "post_id": {"$in": selected}}, {"post_id": 1}
+        )
+        liked_ids = {like["post_id"] async for like in likes_cursor}
+        
+        bookmarks_cursor = db.bookmarks.find(
+            {"user_id": current_user["_id"], "post_id": {"$in": selected}}, {"post_id": 1}
+        )
+        bookmarked_ids = {bookmark["post_id"] async for bookmark in bookmarks_cursor}
     
-    total_count = await db.posts.count_documents({"tags": hashtag})
+    posts = []
+    for post_id in selected:
+        post = posts_by_id.get(str(post_id))
+        if not post:
+            continue  # Deleted since the hot list was written
+        post["_id"] = str(post["_id"])
+        post["is_liked"] = post_id in liked_ids
+        post["is_bookmarked"] = post_id in bookmarked_ids
+        posts.append(post)
+    
+    # Approximate total from the hashtag dictionary instead of count_documents
+    entry = await db.hashtags.find_one({"_id": hashtag_key(hashtag)}, {"usage_count": 1})
+    total_count = entry.get("usage_count", 0) if entry else 0
     
     return {
         "hashtag": hashtag,
-        "posts": [PostResponse.model_validate(post) for post in filtered_posts],
+        "posts": [PostResponse.model_validate(post) for post in posts],
         "total_count": total_count,
-        "has_more": skip + limit < total_count
+        "has_more": has_more,
+        "next_cursor": encode_cursor(last_scanned["created_at"], last_scanned["post_id"]) if has_more else None
     }
 
 @router.get("/search")
@@ -118,27 +120,8 @@ async def search_hashtags(
     current_user: dict = Depends(get_current_user)
 ):
     """Search hashtags by prefix"""
-    db = get_database()
-    
     # Ensure query starts with #
     if not query.startswith('#'):
         query = f"#{query}"
     
-    # Aggregate unique hashtags matching the query
-    pipeline = [
-        {"$unwind": "$tags"},
-        {"$match": {"tags": {"$regex": f"^{query}", "$options": "i"}}},
-        {"$group": {
-            "_id": "$tags",
-            "count": {"$sum": 1}
-        }},
-        {"$sort": {"count": -1}},
-        {"$limit": limit}
-    ]
-    
-    results = await db.posts.aggregate(pipeline).to_list(length=limit)
-    
-    return [{
-        "hashtag": result["_id"],
-        "post_count": result["count"]
-    } for result in results]
+    return await search_hashtag_dictionary(query, limit)
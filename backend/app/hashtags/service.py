@@ -0,0 +1,365 @@
+"""
+Hashtag aggregates maintained by the post write paths
+"""
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional
+from pymongo import DeleteOne, UpdateOne
+from app.database import get_database
+from app.pagination import keyset_after, keyset_sort
+from app.services.background import register_periodic_task
+from app.services.cache import TTLCache
+
+# hashtag_stats holds one {hashtag, bucket, count} row per hashtag per hour
+STATS_RETENTION_DAYS = 31
+STATS_RECONCILE_INTERVAL_SECONDS = 24 * 60 * 60
+
+# hashtags is the dictionary: {_id: lowercase key, hashtag, usage_count, last_used_at}
+DICTIONARY_RECONCILE_INTERVAL_SECONDS = 24 * 60 * 60
+# Prefixes this short match most of the dictionary; they walk the
+# (usage_count, last_used_at) index and stop at the limit instead of
+# sorting every match
+SHORT_PREFIX_LENGTH = 2
+
+# hashtag_posts holds capped lists of the newest posts for the most used hashtags:
+# {_id: lowercase key, posts: [{post_id, author_id, created_at}], complete}
+HOT_HASHTAG_COUNT = 200
+HOT_HASHTAG_LIST_SIZE = 300
+HOT_HASHTAG_REFRESH_INTERVAL_SECONDS = 10 * 60
+
+# Hashtag pages match tags case-insensitively, like the dictionary; the
+# (tags, created_at, _id) page index is built with this collation
+HASHTAG_COLLATION = {"locale": "en", "strength": 2}
+
+trending_cache = TTLCache(ttl_seconds=60, max_entries=500)
+search_cache = TTLCache(ttl_seconds=30, max_entries=2000)
+
+def post_hashtags(tags: Optional[Iterable[str]]) -> List[str]:
+    """Distinct hashtags (tags starting with #) on a post"""
+    return list(dict.fromkeys(tag for tag in (tags or []) if tag.startswith("#")))
+
+def hashtag_key(tag: str) -> str:
+    """Normalized dictionary key for a hashtag"""
+    return tag.strip().lower()
+
+def hashtag_changes(old_tags: Optional[Iterable[str]], new_tags: Optional[Iterable[str]]):
+    """Hashtags an edit adds and removes, compared by key so that a change of
+    case alone is neither"""
+    old_by_key = {hashtag_key(tag): tag for tag in post_hashtags(old_tags)}
+    new_by_key = {hashtag_key(tag): tag for tag in post_hashtags(new_tags)}
+    added = [tag for key, tag in new_by_key.items() if key not in old_by_key]
+    removed = [tag for key, tag in old_by_key.items() if key not in new_by_key]
+    return added, removed
+
+def hour_bucket(value: datetime) -> datetime:
+    """Truncate a timestamp to its UTC hour (stored naive, as Mongo returns it)"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+def stats_cutoff(days: int) -> datetime:
+    """First bucket inside a window of the last N days"""
+    return hour_bucket(datetime.now(timezone.utc) - timedelta(days=days))
+
+async def update_hashtag_stats(created_at: datetime, added: Iterable[str] = (), removed: Iterable[str] = ()):
+    """Apply a post's tag changes to the hour bucket it was created in"""
+    bucket = hour_bucket(created_at)
+    if bucket < stats_cutoff(STATS_RETENTION_DAYS):
+        return
+
+    operations = [
+        UpdateOne({"hashtag": tag, "bucket": bucket}, {"$inc": {"count": 1}}, upsert=True)
+        for tag in post_hashtags(added)
+    ]
+    operations += [
+        UpdateOne({"hashtag": tag, "bucket": bucket, "count": {"$gt": 0}}, {"$inc": {"count": -1}})
+        for tag in post_hashtags(removed)
+    ]
+    if not operations:
+        return
+
+    db = get_database()
+    await db.hashtag_stats.bulk_write(operations, ordered=False)
+
+async def update_hashtag_dictionary(added: Iterable[str] = (), removed: Iterable[str] = ()):
+    """Keep usage counts and last-used times in the hashtags dictionary current"""
+    now = datetime.now(timezone.utc)
+    added_by_key = {hashtag_key(tag): tag for tag in post_hashtags(added)}
+    removed_keys = {hashtag_key(tag) for tag in post_hashtags(removed)}
+
+    operations = [
+        UpdateOne(
+            {"_id": key},
+            {"$inc": {"usage_count": 1}, "$set": {"hashtag": tag, "last_used_at": now}},
+            upsert=True
+        )
+        for key, tag in added_by_key.items()
+    ]
+    operations += [
+        UpdateOne({"_id": key, "usage_count": {"$gt": 0}}, {"$inc": {"usage_count": -1}})
+        for key in removed_keys - added_by_key.keys()
+    ]
+    if not operations:
+        return
+
+    db = get_database()
+    await db.hashtags.bulk_write(operations, ordered=False)
+
+async def update_hot_hashtag_lists(post: dict, added: Iterable[str] = (), removed: Iterable[str] = ()):
+    """Push/pull the post in the precomputed lists of hot hashtags (other tags are skipped)"""
+    db = get_database()
+    added_keys = list({hashtag_key(tag) for tag in post_hashtags(added)})
+    removed_keys = list({hashtag_key(tag) for tag in post_hashtags(removed)} - set(added_keys))
+
+    if added_keys:
+        entry = {
+            "post_id": post["_id"],
+            "author_id": post["author_id"],
+            "created_at": post["created_at"]
+        }
+        # Lists that already hold the post are left alone, so a repeated push
+        # cannot list it twice
+        await db.hashtag_posts.update_many(
+            {"_id": {"$in": added_keys}, "posts.post_id": {"$ne": post["_id"]}},
+            {"$push": {"posts": {
+                "$each": [entry],
+                "$sort": {"created_at": -1, "post_id": -1},
+                "$slice": HOT_HASHTAG_LIST_SIZE
+            }}}
+        )
+    if removed_keys:
+        await db.hashtag_posts.update_many(
+            {"_id": {"$in": removed_keys}},
+            {"$pull": {"posts": {"post_id": post["_id"]}}}
+        )
+
+async def apply_post_tag_changes(post: dict, added: Iterable[str] = (), removed: Iterable[str] = ()):
+    """Update every hashtag aggregate after a post is created, edited or deleted"""
+    await update_hashtag_stats(post["created_at"], added, removed)
+    await update_hashtag_dictionary(added, removed)
+    await update_hot_hashtag_lists(post, added, removed)
+
+async def hashtag_post_batches(hashtag: str, after: Optional[tuple], batch_size: int):
+    """Yield batches of {post_id, author_id, created_at}, newest first, after the
+    (created_at, post_id) position: first from the hot list, then from the
+    (tags, created_at, _id) index for the long tail. Tags match regardless
+    of case."""
+    db = get_database()
+    position = after
+
+    hot = await db.hashtag_posts.find_one({"_id": hashtag_key(hashtag)})
+    if hot:
+        entries = [
+            entry for entry in hot["posts"]
+            if position is None or (entry["created_at"], entry["post_id"]) < position
+        ]
+        for start in range(0, len(entries), batch_size):
+            batch = entries[start:start + batch_size]
+            position = (batch[-1]["created_at"], batch[-1]["post_id"])
+            yield batch
+        if hot.get("complete") and len(hot["posts"]) < HOT_HASHTAG_LIST_SIZE:
+            # The list holds every post with this hashtag
+            return
+
+    while True:
+        query_filter = {"tags": hashtag}
+        if position:
+            query_filter.update(keyset_after("created_at", position[0], position[1]))
+        cursor = db.posts.find(
+            query_filter, {"author_id": 1, "created_at": 1}
+        ).collation(HASHTAG_COLLATION).sort(keyset_sort("created_at")).limit(batch_size)
+        posts = await cursor.to_list(length=batch_size)
+        if not posts:
+            return
+
+        batch = [{
+            "post_id": post["_id"],
+            "author_id": post["author_id"],
+            "created_at": post["created_at"]
+        } for post in posts]
+        position = (batch[-1]["created_at"], batch[-1]["post_id"])
+        yield batch
+
+        if len(posts) < batch_size:
+            return
+
+async def search_hashtag_dictionary(query: str, limit: int) -> list:
+    """Prefix search over the dictionary as an indexed range on the key"""
+    prefix = hashtag_key(query)
+    cache_key = (prefix, limit)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    db = get_database()
+    cursor = db.hashtags.find({
+        "_id": {"$gte": prefix, "$lt": prefix + "\uffff"},
+        "usage_count": {"$gt": 0}
+    }).sort([("usage_count", -1), ("last_used_at", -1)]).limit(limit)
+    if len(prefix) <= SHORT_PREFIX_LENGTH:
+        cursor = cursor.hint([("usage_count", -1), ("last_used_at", -1)])
+    results = await cursor.to_list(length=limit)
+
+    matches = [{
+        "hashtag": result["hashtag"],
+        "post_count": result["usage_count"]
+    } for result in results]
+
+    search_cache.set(cache_key, matches)
+    return matches
+
+async def get_trending(days: int, limit: int) -> list:
+    """Hashtags with the most posts in the last N days, from hour buckets"""
+    cache_key = (days, limit)
+    cached = trending_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    db = get_database()
+    pipeline = [
+        {"$match": {"bucket": {"$gte": stats_cutoff(days)}}},
+        {"$group": {"_id": "$hashtag", "count": {"$sum": "$count"}}},
+        {"$match": {"count": {"$gt": 0}}},
+        {"$sort": {"count": -1}},
+        {"$limit": limit}
+    ]
+    results = await db.hashtag_stats.aggregate(pipeline).to_list(length=limit)
+
+    trending = [{
+        "hashtag": result["_id"],
+        "post_count": result["count"],
+        "trending_score": result["count"]  # Can be enhanced with engagement metrics
+    } for result in results]
+
+    trending_cache.set(cache_key, trending)
+    return trending
+
+async def reconcile_hashtag_stats():
+    """Rebuild the retained hour buckets from posts (backfill and drift repair)"""
+    db = get_database()
+    cutoff = stats_cutoff(STATS_RETENTION_DAYS)
+
+    counts = Counter()
+    cursor = db.posts.find(
+        {"created_at": {"$gte": cutoff}, "tags": {"$regex": "^#"}},
+        {"tags": 1, "created_at": 1}
+    )
+    async for post in cursor:
+        bucket = hour_bucket(post["created_at"])
+        for tag in post_hashtags(post.get("tags")):
+            counts[(tag, bucket)] += 1
+
+    operations = [
+        UpdateOne({"hashtag": tag, "bucket": bucket}, {"$set": {"count": count}}, upsert=True)
+        for (tag, bucket), count in counts.items()
+    ]
+    # Buckets no post counts toward any more (all deleted or edited away);
+    # the count is matched so an increment that lands meanwhile is kept
+    stale = [
+        DeleteOne({"_id": row["_id"], "count": row["count"]})
+        async for row in db.hashtag_stats.find({"bucket": {"$gte": cutoff}})
+        if (row["hashtag"], row["bucket"]) not in counts
+    ]
+    written = len(operations)
+    operations += stale
+    for start in range(0, len(operations), 1000):
+        await db.hashtag_stats.bulk_write(operations[start:start + 1000], ordered=False)
+
+    return {"buckets_written": written, "buckets_removed": len(stale)}
+
+async def reconcile_hashtag_dictionary():
+    """Recount dictionary usage from posts (backfill and drift repair)"""
+    db = get_database()
+
+    pipeline = [
+        {"$match": {"tags": {"$regex": "^#"}}},
+        {"$project": {"tags": {"$setUnion": ["$tags", []]}, "created_at": 1}},
+        {"$unwind": "$tags"},
+        {"$match": {"tags": {"$regex": "^#"}}},
+        {"$group": {
+            "_id": {"$toLower": "$tags"},
+            "hashtag": {"$last": "$tags"},
+            "usage_count": {"$sum": 1},
+            "last_used_at": {"$max": "$created_at"}
+        }}
+    ]
+
+    written = 0
+    operations = []
+    async for entry in db.posts.aggregate(pipeline, allowDiskUse=True):
+        operations.append(UpdateOne(
+            {"_id": entry["_id"]},
+            {"$set": {
+                "hashtag": entry["hashtag"],
+                "usage_count": entry["usage_count"],
+                "last_used_at": entry["last_used_at"]
+            }},
+            upsert=True
+        ))
+        if len(operations) >= 1000:
+            await db.hashtags.bulk_write(operations, ordered=False)
+            written += len(operations)
+            operations = []
+    if operations:
+        await db.hashtags.bulk_write(operations, ordered=False)
+        written += len(operations)
+
+    return {"hashtags_written": written}
+
+async def refresh_hot_hashtag_lists():
+    """Rebuild the capped post lists for the currently most used hashtags"""
+    db = get_database()
+
+    # Reads the first entries of the (usage_count, last_used_at) index
+    cursor = db.hashtags.find(
+        {"usage_count": {"$gt": 0}}, {"hashtag": 1}
+    ).sort([("usage_count", -1), ("last_used_at", -1)]).limit(HOT_HASHTAG_COUNT)
+    hot_tags = {entry["_id"]: entry["hashtag"] async for entry in cursor}
+
+    operations = []
+    for key, tag in hot_tags.items():
+        posts_cursor = db.posts.find(
+            {"tags": tag}, {"author_id": 1, "created_at": 1}
+        ).collation(HASHTAG_COLLATION).sort(keyset_sort("created_at")).limit(HOT_HASHTAG_LIST_SIZE)
+        posts = await posts_cursor.to_list(length=HOT_HASHTAG_LIST_SIZE)
+        operations.append(UpdateOne(
+            {"_id": key},
+            {"$set": {
+                "posts": [{
+                    "post_id": post["_id"],
+                    "author_id": post["author_id"],
+                    "created_at": post["created_at"]
+                } for post in posts],
+                "complete": len(posts) < HOT_HASHTAG_LIST_SIZE,
+                "refreshed_at": datetime.now(timezone.utc)
+            }},
+            upsert=True
+        ))
+
+    if operations:
+        await db.hashtag_posts.bulk_write(operations, ordered=False)
+    # Hashtags that cooled down fall back to the indexed query
+    result = await db.hashtag_posts.delete_many({"_id": {"$nin": list(hot_tags)}})
+
+    return {"lists_refreshed": len(operations), "lists_dropped": result.deleted_count}
+
+hashtag_stats_reconcile_task = register_periodic_task(
+    "hashtag_stats_reconcile",
+    STATS_RECONCILE_INTERVAL_SECONDS,
+    reconcile_hashtag_stats,
+    initial_delay=60
+)
+
+hashtag_dictionary_reconcile_task = register_periodic_task(
+    "hashtag_dictionary_reconcile",
+    DICTIONARY_RECONCILE_INTERVAL_SECONDS,
+    reconcile_hashtag_dictionary,
+    initial_delay=90
+)
+
+hot_hashtag_refresh_task = register_periodic_task(
+    "hot_hashtag_refresh",
+    HOT_HASHTAG_REFRESH_INTERVAL_SECONDS,
+    refresh_hot_hashtag_lists,
+    initial_delay=120
+)
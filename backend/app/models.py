@@ -55,6 +55,13 @@ class UserResponse(BaseModel):
         "json_encoders": {ObjectId: str}
     }
 
+class FollowListUser(UserResponse):
+    """Row of a followers/following list"""
+    is_following: Optional[bool] = None  # Set when the viewer's follow state is requested
+
+class SuggestedUserResponse(UserResponse):
+    mutual_count: int = 0  # Followed by this many of the viewer's follows
+
 # Post Models
 class PostCreate(BaseModel):
     content: str = Field(..., min_length=1, max_length=2000)
@@ -110,6 +117,12 @@ class CommentResponse(BaseModel):
         populate_by_name = True
         json_encoders = {ObjectId: str}
 
+class CommentThreadResponse(CommentResponse):
+    """Comment with its replies nested to the requested depth"""
+    depth: int = 0
+    replies: List["CommentThreadResponse"] = []
+    has_more_replies: bool = False  # More replies exist than were returned
+
 # Pagination and Filter Models
 class PostsResponse(BaseModel):
     posts: List[PostResponse]
@@ -117,6 +130,11 @@ class PostsResponse(BaseModel):
     has_more: bool
     next_skip: Optional[int] = None
 
+class CommentsPage(BaseModel):
+    comments: List[CommentResponse]
+    has_more: bool
+    next_cursor: Optional[str] = None
+
 class PostStatsResponse(BaseModel):
     total_posts: int = 0
     image_posts: int = 0
@@ -207,6 +225,29 @@ class StoryResponse(BaseModel):
         "json_encoders": {ObjectId: str}
     }
 
+class StoryViewBatch(BaseModel):
+    story_ids: List[str] = Field(..., min_length=1, max_length=100)
+
+class FollowRequestBatch(BaseModel):
+    request_ids: List[str] = Field(..., min_length=1, max_length=100)
+    action: str = Field(..., pattern="^(accept|reject)$")
+
+class StoryPreviewResponse(BaseModel):
+    """Story entry in the active-stories tray (no inline media)"""
+    id: str = Field(alias="_id")
+    author_id: str
+    media_type: str
+    thumbnail_url: Optional[str] = None
+    views_count: int = 0
+    created_at: datetime
+    expires_at: datetime
+    is_viewed: Optional[bool] = False
+
+    model_config = {
+        "populate_by_name": True,
+        "json_encoders": {ObjectId: str}
+    }
+
 # Auth Models
 class Token(BaseModel):
     access_token: str
@@ -3,6 +3,9 @@ from typing import List
 from pydantic import BaseModel
 from app.auth.dependencies import get_current_user
 from app.database import get_database
+from app.services.follow_graph import follow_graph
+from app.users.autocomplete import forget_followed_users
+from app.users.router import follow_counter_updates
 from app.utils import get_ist_now
 from bson import ObjectId
 
@@ -44,13 +47,18 @@ async def block_user(
         "created_at": get_ist_now()
     })
     
-    # Remove follow relationships
-    await db.follows.delete_many({
-        "$or": [
-            {"follower_id": current_user["_id"], "following_id": user_id},
-            {"follower_id": user_id, "following_id": current_user["_id"]}
-        ]
-    })
+    # Remove follow relationships in both directions, adjusting counters
+    # only for the edges that actually existed
+    for follower_id, following_id in ((current_user["_id"], user_id), (user_id, current_user["_id"])):
+        result = await db.follows.delete_one({"follower_id": follower_id, "following_id": following_id})
+        if result.deleted_count:
+            await db.users.bulk_write(follow_counter_updates(follower_id, following_id, -1))
+    # Other workers' graph caches catch up when their entries expire; private
+    # content checks read follows directly, so the block takes effect at once
+    follow_graph.remove_edge(current_user["_id"], user_id)
+    follow_graph.remove_edge(user_id, current_user["_id"])
+    forget_followed_users(current_user["_id"])
+    forget_followed_users(user_id)
     
     return {"message": "User blocked successfully"}
 
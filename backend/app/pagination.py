@@ -0,0 +1,48 @@
+"""
+Keyset (cursor) pagination helpers
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Tuple
+from bson import ObjectId
+from fastapi import HTTPException, status
+
+def encode_cursor(sort_value: datetime, doc_id: Any) -> str:
+    """Encode the (sort value, _id) of the last row of a page as an opaque cursor"""
+    payload = {
+        "t": sort_value.isoformat(),
+        "id": str(doc_id),
+        "oid": isinstance(doc_id, ObjectId)
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, Any]:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        doc_id = ObjectId(payload["id"]) if payload.get("oid") else payload["id"]
+        return datetime.fromisoformat(payload["t"]), doc_id
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def keyset_after(field: str, sort_value: datetime, doc_id: Any, descending: bool = True) -> dict:
+    """Filter selecting rows after (sort_value, doc_id) in (field, _id) order"""
+    op = "$lt" if descending else "$gt"
+    return {"$or": [
+        {field: {op: sort_value}},
+        {field: sort_value, "_id": {op: doc_id}}
+    ]}
+
+def keyset_filter(field: str, cursor: str, descending: bool = True) -> dict:
+    """Filter selecting rows after the cursor in (field, _id) order"""
+    sort_value, doc_id = decode_cursor(cursor)
+    return keyset_after(field, sort_value, doc_id, descending)
+
+def keyset_sort(field: str, descending: bool = True) -> list:
+    """Sort matching keyset_filter"""
+    direction = -1 if descending else 1
+    return [(field, direction), ("_id", direction)]
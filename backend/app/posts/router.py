@@ -1,9 +1,14 @@
 from fastapi import APIRouter, HTTPException, status, Depends, Query
 from typing import List, Optional
 from app.models import PostCreate, PostResponse, PostsResponse, PostStatsResponse
+from app.analytics.events import record_event
+from app.analytics.rollups import record_engagement, record_engagement_removed, record_post_created, record_post_deleted
 from app.auth.dependencies import get_current_user
 from app.database import get_database
 from app.notifications.router import create_notification
+from app.hashtags.service import apply_post_tag_changes, hashtag_changes
+from app.posts.stats import apply_post_stats_change, get_post_stats
+from app.services.follow_graph import follow_graph, following_among, is_following_now
 from app.utils import get_ist_now
 from bson import ObjectId
 from datetime import datetime
@@ -44,6 +49,9 @@ async def create_post(
     }
     
     await db.posts.insert_one(post_doc)
+    await apply_post_tag_changes(post_doc, added=post.tags)
+    await apply_post_stats_change(None, post_doc)
+    record_post_created(current_user["_id"])
     
     # Update user's posts count
     await db.users.update_one(
@@ -80,8 +88,7 @@ async def get_feed_posts(
     db = get_database()
     
     # Get posts from followed users and own posts
-    following_cursor = db.follows.find({"follower_id": current_user["_id"]})
-    following_ids = [follow["following_id"] async for follow in following_cursor]
+    following_ids = list(await follow_graph.following(current_user["_id"]))
     following_ids.append(current_user["_id"])  # Include own posts
     
     # Build query filter
@@ -155,21 +162,21 @@ async def get_explore_posts(
     cursor = db.posts.find(query_filter).sort(sort_criteria).skip(skip).limit(limit * 2)
     all_posts = await cursor.to_list(length=limit * 2)
     
-    # Get list of users current user is following
-    following_cursor = db.follows.find({"follower_id": current_user["_id"]})
-    following_ids = [follow["following_id"] async for follow in following_cursor]
+    # Private authors on this page, and which of them the viewer follows
+    # (read from follows, not the cached graph, since this is access control)
+    author_ids = list({post["author_id"] for post in all_posts})
+    private_cursor = db.users.find({"_id": {"$in": author_ids}, "is_private": True}, {"_id": 1})
+    private_ids = {author["_id"] async for author in private_cursor}
+    following_ids = await following_among(current_user["_id"], private_ids - {current_user["_id"]})
     
     # Filter posts based on privacy settings
     filtered_posts = []
     for post in all_posts:
-        # Get post author's privacy settings
-        author = await db.users.find_one({"_id": post["author_id"]})
-        
         # Include post if:
         # 1. Author is not private, OR
         # 2. Current user is the author, OR
         # 3. Current user is following the author
-        if (not author or not author.get("is_private", False) or 
+        if (post["author_id"] not in private_ids or 
             post["author_id"] == current_user["_id"] or 
             post["author_id"] in following_ids):
             filtered_posts.append(post)
@@ -202,32 +209,7 @@ async def get_explore_posts(
 @router.get("/stats", response_model=PostStatsResponse)
 async def get_posts_stats():
     """Get posts statistics for filters"""
-    db = get_database()
-    
-    pipeline = [
-        {
-            "$group": {
-                "_id": None,
-                "total_posts": {"$sum": 1},
-                "image_posts": {
-                    "$sum": {"$cond": [{"$eq": ["$media_type", "image"]}, 1, 0]}
-                },
-                "video_posts": {
-                    "$sum": {"$cond": [{"$eq": ["$media_type", "video"]}, 1, 0]}
-                },
-                "text_posts": {
-                    "$sum": {"$cond": [{"$eq": ["$media_url", None]}, 1, 0]}
-                }
-            }
-        }
-    ]
-    
-    result = await db.posts.aggregate(pipeline).to_list(1)
-    
-    if result:
-        return PostStatsResponse(**result[0])
-    else:
-        return PostStatsResponse()
+    return PostStatsResponse(**await get_post_stats())
 
 @router.get("/user/{user_id}", response_model=List[PostResponse])
 async def get_user_posts(
@@ -247,10 +229,7 @@ async def get_user_posts(
         user_id != current_user["_id"]):
         
         # Check if current user is following the target user
-        is_following = await db.follows.find_one({
-            "follower_id": current_user["_id"],
-            "following_id": user_id
-        })
+        is_following = await is_following_now(current_user["_id"], user_id)
         
         # If not following, return empty list
         if not is_following:
@@ -350,6 +329,8 @@ async def get_post(
                 {"$inc": {"views_count": 1}}
             )
             post["views_count"] = post.get("views_count", 0) + 1
+            record_engagement(post["author_id"], "views")
+            record_event("view", post["author_id"], current_user["_id"], post_id)
     
     # Check if user liked and bookmarked the post
     like = await db.likes.find_one({
@@ -400,6 +381,8 @@ async def toggle_like_post(
             {"_id": post_id},
             {"$inc": {"likes_count": -1}}
         )
+        record_engagement_removed(post["author_id"], "likes")
+        record_event("unlike", post["author_id"], current_user["_id"], post_id)
         
         return {"liked": False, "message": "Post unliked"}
     else:
@@ -415,6 +398,8 @@ async def toggle_like_post(
             {"_id": post_id},
             {"$inc": {"likes_count": 1}}
         )
+        record_engagement(post["author_id"], "likes")
+        record_event("like", post["author_id"], current_user["_id"], post_id)
         
         # Create notification for post author
         await create_notification(
@@ -570,6 +555,10 @@ async def update_post(
         {"$set": update_data}
     )
     
+    added_tags, removed_tags = hashtag_changes(existing_post.get("tags"), post.tags)
+    await apply_post_tag_changes(existing_post, added=added_tags, removed=removed_tags)
+    await apply_post_stats_change(existing_post, {**existing_post, **update_data})
+    
     # Get updated post
     updated_post = await db.posts.find_one({"_id": post_id})
     
@@ -620,6 +609,9 @@ async def delete_post(
     
     # Delete the post
     await db.posts.delete_one({"_id": post_id})
+    await apply_post_tag_changes(existing_post, removed=existing_post.get("tags"))
+    await apply_post_stats_change(existing_post, None)
+    record_post_deleted(existing_post)
     
     # Update user's posts count
     await db.users.update_one(
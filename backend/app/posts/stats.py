@@ -0,0 +1,113 @@
+"""
+Site-wide post counts for the feed filters
+
+A single `post_stats` document holds the totals shown next to the media
+filters. Post create, edit and delete apply their difference to it with
+$inc; reads come from a short-lived per-worker cache. A periodic job
+recounts the posts collection and overwrites the document to correct drift.
+Until the first recount has stamped reconciled_at there is nothing to
+apply differences to, so writes skip the document and reads recount.
+"""
+from datetime import datetime, timezone
+from typing import Optional
+from app.database import get_database
+from app.services.background import register_periodic_task
+from app.services.cache import TTLCache
+
+POST_STATS_ID = "global"
+STATS_FIELDS = ("total_posts", "image_posts", "video_posts", "text_posts")
+STATS_CACHE_TTL_SECONDS = 10
+RECONCILE_INTERVAL_SECONDS = 30 * 60
+
+post_stats_cache = TTLCache(ttl_seconds=STATS_CACHE_TTL_SECONDS, max_entries=1)
+
+def post_stat_counts(post: Optional[dict]) -> dict:
+    """What a single post contributes to each field"""
+    if post is None:
+        return {field: 0 for field in STATS_FIELDS}
+    return {
+        "total_posts": 1,
+        "image_posts": int(post.get("media_type") == "image"),
+        "video_posts": int(post.get("media_type") == "video"),
+        "text_posts": int(post.get("media_url") is None)
+    }
+
+async def apply_post_stats_change(before: Optional[dict], after: Optional[dict]):
+    """Move the counters from a post's old state to its new one; None stands
+    for a post that does not exist (before a create, after a delete)"""
+    old_counts = post_stat_counts(before)
+    new_counts = post_stat_counts(after)
+    delta = {
+        field: new_counts[field] - old_counts[field]
+        for field in STATS_FIELDS
+        if new_counts[field] != old_counts[field]
+    }
+    if not delta:
+        return
+
+    db = get_database()
+    # No upsert: an $inc on a missing document would create partial totals
+    await db.post_stats.update_one(
+        {"_id": POST_STATS_ID, "reconciled_at": {"$exists": True}},
+        {"$inc": delta}
+    )
+    post_stats_cache.invalidate(POST_STATS_ID)
+
+async def reconcile_post_stats():
+    """Recount every post and overwrite the counter document"""
+    db = get_database()
+    pipeline = [
+        {
+            "$group": {
+                "_id": None,
+                "total_posts": {"$sum": 1},
+                "image_posts": {
+                    "$sum": {"$cond": [{"$eq": ["$media_type", "image"]}, 1, 0]}
+                },
+                "video_posts": {
+                    "$sum": {"$cond": [{"$eq": ["$media_type", "video"]}, 1, 0]}
+                },
+                "text_posts": {
+                    "$sum": {"$cond": [{"$eq": ["$media_url", None]}, 1, 0]}
+                }
+            }
+        }
+    ]
+    result = await db.posts.aggregate(pipeline).to_list(1)
+    counts = {field: result[0][field] if result else 0 for field in STATS_FIELDS}
+
+    # Writes that land while the recount runs may be counted twice or not at
+    # all; the next run corrects them
+    previous = await db.post_stats.find_one_and_update(
+        {"_id": POST_STATS_ID},
+        {"$set": {**counts, "reconciled_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    post_stats_cache.invalidate(POST_STATS_ID)
+
+    stored = previous or {}
+    corrected = [field for field in STATS_FIELDS if counts[field] != stored.get(field, 0)]
+    return {"fields_corrected": len(corrected)}
+
+async def get_post_stats() -> dict:
+    cached = post_stats_cache.get(POST_STATS_ID)
+    if cached is not None:
+        return cached
+
+    db = get_database()
+    stats = await db.post_stats.find_one({"_id": POST_STATS_ID})
+    if stats is None or "reconciled_at" not in stats:
+        # First read before the counter document has been counted
+        await reconcile_post_stats()
+        stats = await db.post_stats.find_one({"_id": POST_STATS_ID})
+
+    counts = {field: stats.get(field, 0) for field in STATS_FIELDS}
+    post_stats_cache.set(POST_STATS_ID, counts)
+    return counts
+
+post_stats_reconcile_task = register_periodic_task(
+    "post_stats_reconcile",
+    RECONCILE_INTERVAL_SECONDS,
+    reconcile_post_stats,
+    initial_delay=30
+)
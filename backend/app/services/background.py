@@ -0,0 +1,159 @@
+"""
+Periodic background jobs started from the app lifespan
+"""
+import asyncio
+import os
+import socket
+import time
+from datetime import timedelta
+from typing import Awaitable, Callable, List, Optional
+from pymongo.errors import DuplicateKeyError
+from app.database import get_database
+from app.utils import get_ist_now
+
+# Identifies this process in job lock documents
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+async def acquire_job_lock(name: str, lease_seconds: float) -> bool:
+    """Take the named lease in `job_locks` unless another worker holds it.
+
+    The lease is not released after a run, so with several workers a job
+    runs at most once per lease period across the whole deployment.
+    """
+    db = get_database()
+    now = get_ist_now()
+    try:
+        await db.job_locks.find_one_and_update(
+            {"_id": name, "locked_until": {"$lt": now}},
+            {"$set": {
+                "owner": WORKER_ID,
+                "locked_until": now + timedelta(seconds=lease_seconds),
+                "acquired_at": now
+            }},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # Lock document exists and its lease has not expired
+        return False
+
+async def backfill_completed(name: str) -> bool:
+    """Whether a one-time backfill has recorded completion in `job_checkpoints`"""
+    db = get_database()
+    checkpoint = await db.job_checkpoints.find_one({"_id": f"backfill:{name}"}, {"completed_at": 1})
+    return bool(checkpoint and checkpoint.get("completed_at"))
+
+async def mark_backfill_completed(name: str):
+    """Record that a backfill found nothing left, so later runs return at once"""
+    db = get_database()
+    await db.job_checkpoints.update_one(
+        {"_id": f"backfill:{name}"},
+        {"$set": {"completed_at": get_ist_now()}},
+        upsert=True
+    )
+
+class PeriodicTask:
+    """Runs an async job every `interval_seconds`.
+
+    Deployment-wide jobs run under a shared job lock; per-worker jobs (such as
+    flushing in-memory buffers) pass `use_lock=False`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        interval_seconds: float,
+        job: Callable[[], Awaitable[Optional[dict]]],
+        initial_delay: float = 10,
+        use_lock: bool = True,
+        run_on_shutdown: bool = False
+    ):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.job = job
+        self.initial_delay = initial_delay
+        self.use_lock = use_lock
+        self.run_on_shutdown = run_on_shutdown
+        self._task: Optional[asyncio.Task] = None
+        self.metrics = {
+            "runs": 0,
+            "skipped_runs": 0,
+            "failed_runs": 0,
+            "last_started_at": None,
+            "last_duration_ms": None,
+            "last_result": None,
+            "last_error": None,
+            "totals": {}
+        }
+
+    async def run_once(self):
+        """Run the job now if this worker can take the lock"""
+        if self.use_lock and not await acquire_job_lock(self.name, self.interval_seconds):
+            self.metrics["skipped_runs"] += 1
+            return
+
+        self.metrics["last_started_at"] = get_ist_now()
+        started = time.monotonic()
+        try:
+            result = await self.job() or {}
+        except Exception as e:
+            self.metrics["failed_runs"] += 1
+            self.metrics["last_error"] = str(e)
+            print(f"Background job {self.name} failed: {e}")
+            return
+        finally:
+            self.metrics["last_duration_ms"] = round((time.monotonic() - started) * 1000, 2)
+
+        self.metrics["runs"] += 1
+        self.metrics["last_result"] = result
+        self.metrics["last_error"] = None
+        # Accumulate numeric results (e.g. deleted counts) across runs
+        for key, value in result.items():
+            if isinstance(value, (int, float)):
+                self.metrics["totals"][key] = self.metrics["totals"].get(key, 0) + value
+
+    async def _loop(self):
+        await asyncio.sleep(self.initial_delay)
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            if self.run_on_shutdown:
+                await self.run_once()
+
+periodic_tasks: List[PeriodicTask] = []
+
+def register_periodic_task(
+    name: str,
+    interval_seconds: float,
+    job: Callable[[], Awaitable[Optional[dict]]],
+    initial_delay: float = 10,
+    use_lock: bool = True,
+    run_on_shutdown: bool = False
+) -> PeriodicTask:
+    """Register a job to be started with the app"""
+    task = PeriodicTask(name, interval_seconds, job, initial_delay, use_lock, run_on_shutdown)
+    periodic_tasks.append(task)
+    return task
+
+def start_periodic_tasks():
+    """Start all registered jobs (called from the app lifespan)"""
+    for task in periodic_tasks:
+        task.start()
+
+async def stop_periodic_tasks():
+    """Cancel all registered jobs (called from the app lifespan)"""
+    for task in periodic_tasks:
+        await task.stop()
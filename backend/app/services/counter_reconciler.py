@@ -0,0 +1,143 @@
+"""
+Background reconciliation of denormalized counters
+
+Walks users, posts and comments in `_id` order a batch at a time, recomputes
+their counters with one grouped aggregation per counter over the source
+collection, and writes back only the counters that differ. Progress is kept
+in `job_checkpoints` so each run picks up where the previous one stopped and
+a full pass is spread over many short runs.
+"""
+import asyncio
+from typing import Dict, List, Optional
+from pymongo import UpdateOne
+from app.database import get_database
+from app.services.background import register_periodic_task
+from app.utils import get_ist_now
+
+RECONCILE_INTERVAL_SECONDS = 60
+RECONCILE_BATCH_SIZE = 200
+# Rate limits: documents checked per run, and a pause between batches
+RECONCILE_BATCHES_PER_RUN = 10
+RECONCILE_BATCH_PAUSE_SECONDS = 0.5
+
+class CounterSpec:
+    """A counter field recomputed as the number of `source` documents whose
+    `group_field` equals the counted document's _id, or as the sum of their
+    `sum_field` when one is given"""
+
+    def __init__(
+        self,
+        field: str,
+        source: str,
+        group_field: str,
+        match: Optional[dict] = None,
+        sum_field: Optional[str] = None
+    ):
+        self.field = field
+        self.source = source
+        self.group_field = group_field
+        self.match = match or {}
+        self.sum_field = sum_field
+
+# Collection -> counters kept on its documents; other modules may append
+# specs for counters they own
+RECONCILED_COUNTERS: Dict[str, List[CounterSpec]] = {
+    "users": [
+        CounterSpec("followers_count", "follows", "following_id"),
+        CounterSpec("following_count", "follows", "follower_id"),
+        CounterSpec("posts_count", "posts", "author_id")
+    ],
+    "posts": [
+        CounterSpec("likes_count", "likes", "post_id"),
+        CounterSpec("comments_count", "comments", "post_id", {"deleted_at": None})
+    ],
+    "comments": [
+        CounterSpec("replies_count", "comments", "parent_id", {"deleted_at": None})
+    ]
+}
+
+async def count_grouped(db, spec: CounterSpec, doc_ids: List[str]) -> Dict[str, int]:
+    """Actual counts for a batch of documents; documents with none are omitted"""
+    total = f"${spec.sum_field}" if spec.sum_field else 1
+    pipeline = [
+        {"$match": {spec.group_field: {"$in": doc_ids}, **spec.match}},
+        {"$group": {"_id": f"${spec.group_field}", "count": {"$sum": total}}}
+    ]
+    rows = await db[spec.source].aggregate(pipeline).to_list(length=len(doc_ids))
+    return {row["_id"]: row["count"] for row in rows}
+
+async def reconcile_batch(db, collection: str, after: Optional[str]) -> tuple:
+    """Check one batch; returns (last _id seen or None at the end, checked, fixed)"""
+    specs = RECONCILED_COUNTERS[collection]
+    query = {"_id": {"$gt": after}} if after else {}
+    projection = {spec.field: 1 for spec in specs}
+    cursor = db[collection].find(query, projection).sort("_id", 1).limit(RECONCILE_BATCH_SIZE)
+    docs = await cursor.to_list(length=RECONCILE_BATCH_SIZE)
+    if not docs:
+        return None, 0, 0
+
+    doc_ids = [doc["_id"] for doc in docs]
+    actual = {spec.field: await count_grouped(db, spec, doc_ids) for spec in specs}
+
+    operations = []
+    for doc in docs:
+        for spec in specs:
+            expected = actual[spec.field].get(doc["_id"], 0)
+            stored = doc.get(spec.field)
+            if stored != expected:
+                # Compare-and-set: if a request changed the counter since it
+                # was read, leave it for the next pass instead of losing the $inc
+                operations.append(UpdateOne(
+                    {"_id": doc["_id"], spec.field: stored},
+                    {"$set": {spec.field: expected}}
+                ))
+
+    fixed = 0
+    if operations:
+        result = await db[collection].bulk_write(operations, ordered=False)
+        fixed = result.modified_count
+
+    last_id = doc_ids[-1] if len(docs) == RECONCILE_BATCH_SIZE else None
+    return last_id, len(docs), fixed
+
+async def reconcile_collection(db, collection: str, max_batches: int) -> dict:
+    """Continue this collection's pass from its checkpoint for up to max_batches"""
+    checkpoint_id = f"counter_reconcile:{collection}"
+    checkpoint = await db.job_checkpoints.find_one({"_id": checkpoint_id}) or {}
+    after = checkpoint.get("last_id")
+
+    checked = fixed = 0
+    for batch in range(max_batches):
+        if batch:
+            await asyncio.sleep(RECONCILE_BATCH_PAUSE_SECONDS)
+        after, batch_checked, batch_fixed = await reconcile_batch(db, collection, after)
+        checked += batch_checked
+        fixed += batch_fixed
+        if after is None:
+            break
+
+    update = {"$set": {"last_id": after, "updated_at": get_ist_now()}}
+    if after is None:
+        # Pass complete; the next run starts again from the first document
+        update["$set"]["last_pass_completed_at"] = get_ist_now()
+        update["$inc"] = {"passes": 1}
+    await db.job_checkpoints.update_one({"_id": checkpoint_id}, update, upsert=True)
+
+    return {"checked": checked, "fixed": fixed}
+
+async def reconcile_counters():
+    """One rate-limited step of the reconciliation pass over every collection"""
+    db = get_database()
+    result = {}
+    for collection in RECONCILED_COUNTERS:
+        progress = await reconcile_collection(db, collection, RECONCILE_BATCHES_PER_RUN)
+        result[f"{collection}_checked"] = progress["checked"]
+        result[f"{collection}_fixed"] = progress["fixed"]
+    return result
+
+counter_reconcile_task = register_periodic_task(
+    "counter_reconcile",
+    RECONCILE_INTERVAL_SECONDS,
+    reconcile_counters,
+    initial_delay=60
+)
@@ -0,0 +1,70 @@
+"""
+Write-behind buffers for denormalized counters
+"""
+import asyncio
+from collections import defaultdict
+from typing import Dict
+from pymongo import UpdateOne
+from app.database import get_database
+
+class CounterBuffer:
+    """Aggregates `$inc` updates in memory and writes them with one bulk_write.
+
+    Hot paths call `increment()` instead of issuing an `update_one` each; the
+    pending deltas are flushed periodically (and when the buffer grows past
+    `max_pending` documents). Counters may lag by one flush interval. With
+    `upsert=True` a flush creates counter documents that do not exist yet.
+    """
+
+    def __init__(self, collection_name: str, max_pending: int = 1000, upsert: bool = False):
+        self.collection_name = collection_name
+        self.max_pending = max_pending
+        self.upsert = upsert
+        self._pending: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._flush_task = None
+
+    def increment(self, doc_id: str, field: str, amount: int = 1):
+        """Queue `$inc {field: amount}` for a document"""
+        self._pending[doc_id][field] += amount
+        if len(self._pending) >= self.max_pending and self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_in_background())
+
+    def pending_delta(self, doc_id: str, field: str) -> int:
+        """Increment not yet written for a document field"""
+        fields = self._pending.get(doc_id)
+        return fields.get(field, 0) if fields else 0
+
+    async def _flush_in_background(self):
+        try:
+            await self.flush()
+        finally:
+            self._flush_task = None
+
+    async def flush(self) -> dict:
+        """Write all pending increments"""
+        if not self._pending:
+            return {"documents_updated": 0}
+
+        pending, self._pending = self._pending, defaultdict(lambda: defaultdict(int))
+        operations = [
+            UpdateOne({"_id": doc_id}, {"$inc": dict(fields)}, upsert=self.upsert)
+            for doc_id, fields in pending.items()
+            if any(fields.values())
+        ]
+        if not operations:
+            return {"documents_updated": 0}
+
+        db = get_database()
+        try:
+            await db[self.collection_name].bulk_write(operations, ordered=False)
+        except Exception:
+            # Put the deltas back so the next flush retries them
+            self._merge(pending)
+            raise
+
+        return {"documents_updated": len(operations)}
+
+    def _merge(self, pending: Dict[str, Dict[str, int]]):
+        for doc_id, fields in pending.items():
+            for field, amount in fields.items():
+                self._pending[doc_id][field] += amount
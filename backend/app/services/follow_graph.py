@@ -0,0 +1,112 @@
+"""
+In-memory follow graph shared by the feed, explore, stories and hashtag routes
+
+Holds each active user's following set as a sorted list of IDs, bounded by
+LRU. Follow writes in this worker update it write-through; entries also
+expire after a TTL so changes made through other workers show up.
+
+Because of that TTL the graph is only good for ranking and candidate
+selection. Access-control checks (private profiles) go through
+is_following_now / following_among, which read `follows` directly.
+"""
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from typing import Iterable, List, Set
+from app.database import get_database
+from app.services.cache import SingleFlight
+
+MAX_CACHED_USERS = 20000
+ENTRY_TTL_SECONDS = 5 * 60
+
+class FollowingSet:
+    """Sorted array of followed user IDs with O(log n) membership"""
+    __slots__ = ("ids",)
+
+    def __init__(self, ids: Iterable[str]):
+        self.ids: List[str] = sorted(set(ids))
+
+    def __contains__(self, user_id: str) -> bool:
+        index = bisect_left(self.ids, user_id)
+        return index < len(self.ids) and self.ids[index] == user_id
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def add(self, user_id: str):
+        if user_id not in self:
+            insort(self.ids, user_id)
+
+    def discard(self, user_id: str):
+        index = bisect_left(self.ids, user_id)
+        if index < len(self.ids) and self.ids[index] == user_id:
+            del self.ids[index]
+
+class FollowGraph:
+    def __init__(self, max_users: int = MAX_CACHED_USERS, ttl_seconds: float = ENTRY_TTL_SECONDS):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._loads = SingleFlight()
+
+    async def following(self, user_id: str) -> FollowingSet:
+        """IDs the user follows, loaded from `follows` on a miss"""
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(user_id)
+            return entry[1]
+        return await self._loads.do(user_id, lambda: self._load(user_id))
+
+    async def _load(self, user_id: str) -> FollowingSet:
+        db = get_database()
+        cursor = db.follows.find({"follower_id": user_id}, {"following_id": 1, "_id": 0})
+        following = FollowingSet([follow["following_id"] async for follow in cursor])
+
+        self._entries[user_id] = (time.monotonic() + self.ttl_seconds, following)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+        return following
+
+    async def is_following(self, follower_id: str, following_id: str) -> bool:
+        return following_id in await self.following(follower_id)
+
+    def add_edge(self, follower_id: str, following_id: str):
+        """Write-through after a follow is created"""
+        entry = self._entries.get(follower_id)
+        if entry is not None:
+            entry[1].add(following_id)
+
+    def remove_edge(self, follower_id: str, following_id: str):
+        """Write-through after a follow is deleted"""
+        entry = self._entries.get(follower_id)
+        if entry is not None:
+            entry[1].discard(following_id)
+
+    def invalidate(self, user_id: str):
+        self._entries.pop(user_id, None)
+
+follow_graph = FollowGraph()
+
+async def is_following_now(follower_id: str, following_id: str) -> bool:
+    """Authoritative follow check for access control"""
+    db = get_database()
+    follow = await db.follows.find_one(
+        {"follower_id": follower_id, "following_id": following_id}, {"_id": 1}
+    )
+    return follow is not None
+
+async def following_among(follower_id: str, user_ids: Iterable[str]) -> Set[str]:
+    """Which of user_ids the follower follows, read from `follows`"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return set()
+    db = get_database()
+    cursor = db.follows.find(
+        {"follower_id": follower_id, "following_id": {"$in": user_ids}},
+        {"following_id": 1, "_id": 0}
+    )
+    return {follow["following_id"] async for follow in cursor}
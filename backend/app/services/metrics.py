@@ -0,0 +1,292 @@
+"""
+Per-request database instrumentation and Prometheus metrics
+
+A pymongo command listener attributes every command to the HTTP request that
+issued it through a context variable. Motor runs pymongo in executor threads
+with a copy of the caller's context, so the listener sees the request's
+stats object. The ASGI middleware opens that context, times the request and
+folds its totals into per-route metrics when it finishes. Commands issued
+outside a request (background jobs) are reported under the "background"
+route.
+
+Metrics are kept per worker process and served as Prometheus text from
+/metrics, so each worker has to be scraped on its own.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+import bson
+from pymongo import monitoring
+from app.services.background import periodic_tasks, register_periodic_task
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COMMAND_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+LOOP_LAG_INTERVAL_SECONDS = 1
+
+BACKGROUND_ROUTE = "background"
+UNMATCHED_ROUTE = "unmatched"
+
+# Debug mode: adds X-DB-Query-Count and X-DB-Time-Ms to every response and
+# measures cursor replies exactly instead of estimating them (see reply_size)
+DEBUG_QUERY_HEADERS = os.getenv("DEBUG_QUERY_HEADERS", "").lower() in ("1", "true", "yes")
+
+def format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+def format_value(value: float) -> str:
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+class Counter:
+    """Monotonic counter per label set"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[tuple, float] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in items:
+            lines.append(f"{self.name}{format_labels(self.label_names, labels)} {format_value(value)}")
+        return lines
+
+class Histogram:
+    """Bucketed observations per label set"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((labels, [list(series[0]), series[1], series[2]]) for labels, series in self._series.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        names = self.label_names + ("le",)
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{format_labels(names, labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, labels)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, labels)} {count}")
+        return lines
+
+http_requests = Counter(
+    "http_requests_total", "HTTP requests handled", ("method", "route", "status")
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Time until the response body was sent",
+    ("method", "route"), LATENCY_BUCKETS
+)
+http_request_commands = Histogram(
+    "http_request_mongo_commands", "MongoDB commands issued per request",
+    ("method", "route"), COMMAND_COUNT_BUCKETS
+)
+mongo_commands = Counter(
+    "mongo_commands_total", "MongoDB commands by route and command name", ("route", "command")
+)
+mongo_seconds = Counter(
+    "mongo_command_seconds_total", "Time spent in MongoDB commands", ("route",)
+)
+mongo_reply_bytes = Counter(
+    "mongo_reply_bytes_total", "BSON bytes returned by MongoDB (cursor batches estimated outside debug mode)", ("route",)
+)
+event_loop_lag = Histogram(
+    "event_loop_lag_seconds", "How late a periodic timer fired on the event loop",
+    (), LOOP_LAG_BUCKETS
+)
+
+class RequestStats:
+    """Database usage of one request; updated from pymongo's executor threads"""
+
+    def __init__(self):
+        self.commands: Dict[str, int] = defaultdict(int)
+        self.command_count = 0
+        self.mongo_seconds = 0.0
+        self.reply_bytes = 0
+        self._lock = threading.Lock()
+
+    def record(self, command: str, seconds: float, reply_bytes: int):
+        with self._lock:
+            self.commands[command] += 1
+            self.command_count += 1
+            self.mongo_seconds += seconds
+            self.reply_bytes += reply_bytes
+
+current_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("current_request_stats", default=None)
+
+def record_route_commands(route: str, commands: Dict[str, int], seconds: float, reply_bytes: int):
+    for command, count in commands.items():
+        mongo_commands.inc((route, command), count)
+    mongo_seconds.inc((route,), seconds)
+    mongo_reply_bytes.inc((route,), reply_bytes)
+
+def record_command(command: str, duration_micros: int, reply_bytes: int):
+    seconds = duration_micros / 1_000_000
+    stats = current_request_stats.get()
+    if stats is not None:
+        stats.record(command, seconds, reply_bytes)
+    else:
+        record_route_commands(BACKGROUND_ROUTE, {command: 1}, seconds, reply_bytes)
+
+def document_size(document) -> int:
+    raw = getattr(document, "raw", None)
+    return len(raw) if raw is not None else len(bson.encode(document))
+
+def reply_size(reply) -> int:
+    """BSON size of a command reply. pymongo hands listeners decoded replies,
+    and re-encoding a large cursor batch costs milliseconds on the driver
+    thread, so outside debug mode a batch is estimated as its first
+    document's size times its length"""
+    cursor = reply.get("cursor")
+    batch = (cursor.get("firstBatch") or cursor.get("nextBatch")) if isinstance(cursor, dict) else None
+    if DEBUG_QUERY_HEADERS or not batch:
+        return document_size(reply)
+    return document_size(batch[0]) * len(batch)
+
+class MongoCommandListener(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        record_command(event.command_name, event.duration_micros, reply_size(event.reply))
+
+    def failed(self, event):
+        record_command(event.command_name, event.duration_micros, 0)
+
+# Registered globally so it applies to the client created at startup
+monitoring.register(MongoCommandListener())
+
+def route_label(scope: dict) -> str:
+    """The matched route's path template, so IDs don't become labels"""
+    route = scope.get("route")
+    return getattr(route, "path", UNMATCHED_ROUTE)
+
+class MetricsMiddleware:
+    """ASGI middleware that times each HTTP request and collects its
+    database usage"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        started = time.perf_counter()
+        response = {"status": 500, "finished_at": None}
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                if DEBUG_QUERY_HEADERS:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-db-query-count", str(stats.command_count).encode()))
+                    headers.append((b"x-db-time-ms", f"{stats.mongo_seconds * 1000:.1f}".encode()))
+                    message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                response["finished_at"] = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            current_request_stats.reset(token)
+            # Background tasks run after the body is sent; their commands
+            # count toward the request but their time does not
+            duration = (response["finished_at"] or time.perf_counter()) - started
+            route = route_label(scope)
+            method = scope["method"]
+            http_requests.inc((method, route, str(response["status"])))
+            http_request_duration.observe((method, route), duration)
+            http_request_commands.observe((method, route), stats.command_count)
+            record_route_commands(route, stats.commands, stats.mongo_seconds, stats.reply_bytes)
+
+class LoopLagProbe:
+    """Measures how much later than scheduled each tick runs"""
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self.expected_at: Optional[float] = None
+
+    async def tick(self):
+        now = time.monotonic()
+        if self.expected_at is not None:
+            event_loop_lag.observe((), max(0.0, now - self.expected_at))
+        self.expected_at = now + self.interval_seconds
+
+loop_lag_probe = LoopLagProbe(LOOP_LAG_INTERVAL_SECONDS)
+
+def render_job_metrics() -> List[str]:
+    series: List[Tuple[str, str, str, str]] = [
+        ("background_job_runs_total", "counter", "Completed runs", "runs"),
+        ("background_job_failed_runs_total", "counter", "Runs that raised", "failed_runs"),
+        ("background_job_skipped_runs_total", "counter", "Runs skipped because another worker held the lock", "skipped_runs")
+    ]
+    lines = []
+    for name, kind, help_text, key in series:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        lines += [f'{name}{format_labels(("job",), (task.name,))} {task.metrics[key]}' for task in periodic_tasks]
+
+    name = "background_job_last_duration_seconds"
+    lines += [f"# HELP {name} Duration of the most recent run", f"# TYPE {name} gauge"]
+    for task in periodic_tasks:
+        if task.metrics["last_duration_ms"] is not None:
+            lines.append(f'{name}{format_labels(("job",), (task.name,))} {format_value(task.metrics["last_duration_ms"] / 1000)}')
+    return lines
+
+def render_metrics() -> str:
+    """Every metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in (
+        http_requests, http_request_duration, http_request_commands,
+        mongo_commands, mongo_seconds, mongo_reply_bytes, event_loop_lag
+    ):
+        lines += metric.render()
+    lines += render_job_metrics()
+    return "\n".join(lines) + "\n"
+
+loop_lag_task = register_periodic_task(
+    "event_loop_lag_probe",
+    LOOP_LAG_INTERVAL_SECONDS,
+    loop_lag_probe.tick,
+    initial_delay=LOOP_LAG_INTERVAL_SECONDS,
+    use_lock=False
+)
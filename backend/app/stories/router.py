@@ -1,14 +1,53 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List
-from app.models import StoryCreate, StoryResponse
+from fastapi import APIRouter, HTTPException, status, Depends, Query
+from typing import List, Optional
+from app.models import StoryCreate, StoryResponse, StoryPreviewResponse, StoryViewBatch
 from app.auth.dependencies import get_current_user
 from app.database import get_database
+from app.pagination import encode_cursor, keyset_filter, keyset_sort
+from app.services.background import register_periodic_task
+from app.services.cache import TTLCache
+from app.services.counters import CounterBuffer
+from app.services.follow_graph import follow_graph
 from app.utils import get_ist_now
 from datetime import timedelta, datetime
 from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
 router = APIRouter(prefix="/stories", tags=["stories"])
 
+STORY_LIFETIME = timedelta(hours=24)
+
+# The TTL index on expires_at waits this long past expiry, so the cleanup
+# job normally deletes a story's views before Mongo deletes the story itself
+STORY_TTL_GRACE_SECONDS = 3600
+STORY_CLEANUP_INTERVAL_SECONDS = 300
+STORY_CLEANUP_BATCH_SIZE = 500
+
+# Fields sent in the tray; media is fetched per story when it is opened
+TRAY_STORY_PROJECTION = {
+    "author_id": 1,
+    "author_username": 1,
+    "author_displayName": 1,
+    "author_photo": 1,
+    "media_type": 1,
+    "thumbnail_url": 1,
+    "views_count": 1,
+    "created_at": 1,
+    "expires_at": 1
+}
+
+# Per-viewer tray cache: {"author_ids": set, "tray": list}
+tray_cache = TTLCache(ttl_seconds=30, max_entries=5000)
+
+# views_count increments are buffered and flushed in one bulk_write
+STORY_VIEW_FLUSH_INTERVAL_SECONDS = 2
+story_views_counter = CounterBuffer("stories")
+
+def invalidate_tray_for_author(author_id: str):
+    """Drop every cached tray that includes stories from this author"""
+    tray_cache.invalidate_where(lambda viewer_id, entry: author_id in entry["author_ids"])
+
 @router.post("/", response_model=StoryResponse)
 async def create_story(
     story: StoryCreate,
@@ -19,7 +58,7 @@ async def create_story(
     
     story_id = str(ObjectId())
     now = get_ist_now()
-    expires_at = now + timedelta(hours=24)
+    expires_at = now + STORY_LIFETIME
     
     story_doc = {
         "_id": story_id,
@@ -36,6 +75,7 @@ async def create_story(
     }
     
     await db.stories.insert_one(story_doc)
+    invalidate_tray_for_author(current_user["_id"])
     
     return StoryResponse(**story_doc)
 
@@ -44,24 +84,35 @@ async def get_active_stories(
     current_user: dict = Depends(get_current_user)
 ):
     """Get all active stories from followed users and self"""
+    cached = tray_cache.get(current_user["_id"])
+    if cached is not None:
+        return cached["tray"]
+    
     db = get_database()
     
-    # Get list of users current user follows
-    cursor = db.follows.find({"follower_id": current_user["_id"]})
-    follows = await cursor.to_list(length=1000)
-    following_ids = [follow["following_id"] for follow in follows]
+    # Get every user current user follows
+    following_ids = await follow_graph.following(current_user["_id"])
     
     # Include current user's ID
-    user_ids = following_ids + [current_user["_id"]]
+    user_ids = list(following_ids) + [current_user["_id"]]
     
     # Get active stories (not expired) from these users
     now = get_ist_now()
     cursor = db.stories.find({
         "author_id": {"$in": user_ids},
         "expires_at": {"$gt": now}
-    }).sort("created_at", -1)
+    }, TRAY_STORY_PROJECTION).sort("created_at", -1)
     
-    stories = await cursor.to_list(length=1000)
+    stories = [story async for story in cursor]
+    
+    # Check which of these stories the current user has viewed in one query
+    viewed_ids = set()
+    if stories:
+        cursor = db.story_views.find({
+            "viewer_id": current_user["_id"],
+            "story_id": {"$in": [story["_id"] for story in stories]}
+        }, {"story_id": 1, "_id": 0})
+        viewed_ids = {view["story_id"] async for view in cursor}
     
     # Group stories by author
     stories_by_author = {}
@@ -77,17 +128,11 @@ async def get_active_stories(
                 "has_unseen": False
             }
         
-        # Check if story is viewed by current user
-        view = await db.story_views.find_one({
-            "story_id": story["_id"],
-            "viewer_id": current_user["_id"]
-        })
-        
-        story["is_viewed"] = view is not None
+        story["is_viewed"] = story["_id"] in viewed_ids
         if not story["is_viewed"]:
             stories_by_author[author_id]["has_unseen"] = True
         
-        stories_by_author[author_id]["stories"].append(StoryResponse(**story).model_dump(by_alias=True))
+        stories_by_author[author_id]["stories"].append(StoryPreviewResponse(**story).model_dump(by_alias=True))
     
     # Convert to list and sort (current user first, then by has_unseen)
     result = list(stories_by_author.values())
@@ -97,6 +142,8 @@ async def get_active_stories(
         -len(x["stories"])  # Then by story count
     ))
     
+    tray_cache.set(current_user["_id"], {"author_ids": set(user_ids), "tray": result})
+    
     return result
 
 @router.get("/{story_id}", response_model=StoryResponse)
@@ -131,6 +178,17 @@ async def get_story(
     
     return StoryResponse(**story)
 
+def story_view_upsert(story_id: str, viewer: dict) -> tuple:
+    """Filter and update that record a view on the unique (story_id, viewer_id) index"""
+    view_filter = {"story_id": story_id, "viewer_id": viewer["_id"]}
+    view_update = {"$setOnInsert": {
+        "viewer_username": viewer["username"],
+        "viewer_displayName": viewer["displayName"],
+        "viewer_photo": viewer.get("photoURL"),
+        "viewed_at": get_ist_now()
+    }}
+    return view_filter, view_update
+
 @router.post("/{story_id}/view")
 async def mark_story_viewed(
     story_id: str,
@@ -140,7 +198,7 @@ async def mark_story_viewed(
     db = get_database()
     
     # Check if story exists
-    story = await db.stories.find_one({"_id": story_id})
+    story = await db.stories.find_one({"_id": story_id}, {"author_id": 1})
     if not story:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -151,41 +209,64 @@ async def mark_story_viewed(
     if story["author_id"] == current_user["_id"]:
         return {"message": "Own story view not counted"}
     
-    # Check if already viewed
-    existing_view = await db.story_views.find_one({
-        "story_id": story_id,
-        "viewer_id": current_user["_id"]
-    })
+    # Add view if not already viewed
+    view_filter, view_update = story_view_upsert(story_id, current_user)
+    try:
+        result = await db.story_views.update_one(view_filter, view_update, upsert=True)
+        is_new_view = result.upserted_id is not None
+    except DuplicateKeyError:
+        # Concurrent request recorded the same view
+        is_new_view = False
     
-    if not existing_view:
-        # Add view
-        await db.story_views.insert_one({
-            "story_id": story_id,
-            "viewer_id": current_user["_id"],
-            "viewer_username": current_user["username"],
-            "viewer_displayName": current_user["displayName"],
-            "viewer_photo": current_user.get("photoURL"),
-            "viewed_at": get_ist_now()
-        })
-        
-        # Increment view count
-        await db.stories.update_one(
-            {"_id": story_id},
-            {"$inc": {"views_count": 1}}
-        )
+    if is_new_view:
+        story_views_counter.increment(story_id, "views_count")
+        tray_cache.invalidate(current_user["_id"])
     
     return {"message": "Story viewed"}
 
-@router.get("/{story_id}/viewers", response_model=List[dict])
-async def get_story_viewers(
-    story_id: str,
+@router.post("/views")
+async def mark_stories_viewed(
+    batch: StoryViewBatch,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get list of users who viewed the story"""
+    """Mark several stories as viewed in one call"""
     db = get_database()
     
-    # Check if story belongs to current user
-    story = await db.stories.find_one({"_id": story_id})
+    story_ids = list(dict.fromkeys(batch.story_ids))
+    
+    # Only active stories by other users count as views
+    cursor = db.stories.find({
+        "_id": {"$in": story_ids},
+        "author_id": {"$ne": current_user["_id"]},
+        "expires_at": {"$gt": get_ist_now()}
+    }, {"_id": 1})
+    countable_ids = [story["_id"] async for story in cursor]
+    
+    if not countable_ids:
+        return {"message": "Stories viewed", "new_views": 0}
+    
+    operations = [
+        UpdateOne(*story_view_upsert(story_id, current_user), upsert=True)
+        for story_id in countable_ids
+    ]
+    try:
+        result = await db.story_views.bulk_write(operations, ordered=False)
+        upserted = result.upserted_ids
+    except BulkWriteError as e:
+        # Duplicate keys from concurrent requests; keep the views that were inserted
+        upserted = {item["index"]: item["_id"] for item in e.details.get("upserted", [])}
+    
+    for index in upserted:
+        story_views_counter.increment(countable_ids[index], "views_count")
+    
+    if upserted:
+        tray_cache.invalidate(current_user["_id"])
+    
+    return {"message": "Stories viewed", "new_views": len(upserted)}
+
+async def get_own_story(db, story_id: str, current_user: dict) -> dict:
+    """Load a story the current user authored, for viewer-list routes"""
+    story = await db.stories.find_one({"_id": story_id}, {"author_id": 1, "views_count": 1})
     if not story:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -198,17 +279,57 @@ async def get_story_viewers(
             detail="You can only view your own story viewers"
         )
     
-    # Get viewers
-    cursor = db.story_views.find({"story_id": story_id}).sort("viewed_at", -1)
-    views = await cursor.to_list(length=1000)
-    
-    return [{
-        "viewer_id": view["viewer_id"],
-        "viewer_username": view["viewer_username"],
-        "viewer_displayName": view["viewer_displayName"],
-        "viewer_photo": view.get("viewer_photo"),
-        "viewed_at": view["viewed_at"]
-    } for view in views]
+    return story
+
+@router.get("/{story_id}/viewers")
+async def get_story_viewers(
+    story_id: str,
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(50, ge=1, le=100),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get users who viewed the story, newest first, one page at a time"""
+    db = get_database()
+    
+    await get_own_story(db, story_id, current_user)
+    
+    # Keyset pagination on (story_id, viewed_at, _id)
+    query_filter = {"story_id": story_id}
+    if cursor:
+        query_filter.update(keyset_filter("viewed_at", cursor))
+    
+    views_cursor = db.story_views.find(query_filter).sort(keyset_sort("viewed_at")).limit(limit + 1)
+    views = await views_cursor.to_list(length=limit + 1)
+    
+    has_more = len(views) > limit
+    views = views[:limit]
+    
+    return {
+        "viewers": [{
+            "viewer_id": view["viewer_id"],
+            "viewer_username": view["viewer_username"],
+            "viewer_displayName": view["viewer_displayName"],
+            "viewer_photo": view.get("viewer_photo"),
+            "viewed_at": view["viewed_at"]
+        } for view in views],
+        "has_more": has_more,
+        "next_cursor": encode_cursor(views[-1]["viewed_at"], views[-1]["_id"]) if has_more else None
+    }
+
+@router.get("/{story_id}/viewers/count")
+async def get_story_viewer_count(
+    story_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get the number of users who viewed the story"""
+    db = get_database()
+    
+    story = await get_own_story(db, story_id, current_user)
+    
+    # Include increments still waiting in the write-behind buffer
+    views_count = story.get("views_count", 0) + story_views_counter.pending_delta(story_id, "views_count")
+    
+    return {"story_id": story_id, "views_count": views_count}
 
 @router.delete("/{story_id}")
 async def delete_story(
@@ -238,26 +359,72 @@ async def delete_story(
     # Delete all views
     await db.story_views.delete_many({"story_id": story_id})
     
+    invalidate_tray_for_author(current_user["_id"])
+    
     return {"message": "Story deleted successfully"}
 
 # Background task to clean up expired stories
 async def cleanup_expired_stories():
-    """Delete expired stories (run periodically)"""
+    """Delete expired stories and their views in batches (run periodically)"""
     db = get_database()
     
     now = get_ist_now()
-    
-    # Find expired stories
-    cursor = db.stories.find({"expires_at": {"$lt": now}})
-    expired_stories = await cursor.to_list(length=10000)
-    
-    if expired_stories:
-        expired_ids = [story["_id"] for story in expired_stories]
+    stories_deleted = 0
+    views_deleted = 0
+    
+    # Stream expired story IDs; views go first so a crash never orphans them
+    while True:
+        cursor = db.stories.find(
+            {"expires_at": {"$lt": now}}, {"_id": 1}
+        ).sort("expires_at", 1).limit(STORY_CLEANUP_BATCH_SIZE)
+        expired_ids = [story["_id"] async for story in cursor]
+        
+        if not expired_ids:
+            break
+        
+        result = await db.story_views.delete_many({"story_id": {"$in": expired_ids}})
+        views_deleted += result.deleted_count
         
-        # Delete expired stories
-        await db.stories.delete_many({"_id": {"$in": expired_ids}})
+        result = await db.stories.delete_many({"_id": {"$in": expired_ids}})
+        stories_deleted += result.deleted_count
         
-        # Delete their views
-        await db.story_views.delete_many({"story_id": {"$in": expired_ids}})
+        if len(expired_ids) < STORY_CLEANUP_BATCH_SIZE:
+            break
+    
+    # Views left behind when the TTL monitor removed the story first.
+    # Stories live 24 hours, so any view older than that belongs to an expired story.
+    orphan_cutoff = now - STORY_LIFETIME
+    while True:
+        cursor = db.story_views.find(
+            {"viewed_at": {"$lt": orphan_cutoff}}, {"_id": 1}
+        ).limit(STORY_CLEANUP_BATCH_SIZE)
+        orphan_ids = [view["_id"] async for view in cursor]
         
-        print(f"Cleaned up {len(expired_ids)} expired stories")
+        if not orphan_ids:
+            break
+        
+        result = await db.story_views.delete_many({"_id": {"$in": orphan_ids}})
+        views_deleted += result.deleted_count
+        
+        if len(orphan_ids) < STORY_CLEANUP_BATCH_SIZE:
+            break
+    
+    if stories_deleted or views_deleted:
+        print(f"Cleaned up {stories_deleted} expired stories and {views_deleted} story views")
+    
+    return {"stories_deleted": stories_deleted, "views_deleted": views_deleted}
+
+story_cleanup_task = register_periodic_task(
+    "story_cleanup",
+    STORY_CLEANUP_INTERVAL_SECONDS,
+    cleanup_expired_stories
+)
+
+story_views_counter_task = register_periodic_task(
+    "story_views_counter_flush",
+    STORY_VIEW_FLUSH_INTERVAL_SECONDS,
+    story_views_counter.flush,
+    initial_delay=STORY_VIEW_FLUSH_INTERVAL_SECONDS,
+    use_lock=False,
+    run_on_shutdown=True
+)
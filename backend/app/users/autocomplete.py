@@ -0,0 +1,183 @@
+"""
+In-memory username trie for @mention autocomplete
+
+The trie holds the most followed users (bounded by MAX_INDEXED_USERS). Every
+node keeps the top NODE_TOP_K users under it, so a lookup walks the prefix
+and reads a precomputed list. Users the viewer follows are matched from a
+short-lived per-viewer list and ranked first.
+
+Each worker builds the trie at startup, yielding to the event loop as it
+goes, and patches it on register and profile updates. A slow periodic
+rebuild picks up changes in follower counts.
+"""
+import asyncio
+from bisect import insort
+from typing import Dict, List
+from app.database import get_database
+from app.services.background import register_periodic_task
+from app.services.cache import TTLCache
+from app.services.follow_graph import follow_graph
+
+MAX_INDEXED_USERS = 50000
+# Prefixes longer than this are matched by filtering the deepest node's list
+MAX_PREFIX_LENGTH = 12
+NODE_TOP_K = 20
+REBUILD_INTERVAL_SECONDS = 6 * 60 * 60
+# Users added between yields to the event loop during a build
+BUILD_YIELD_EVERY = 1000
+
+SUMMARY_PROJECTION = {
+    "username": 1,
+    "displayName": 1,
+    "photoURL": 1,
+    "is_verified": 1,
+    "followers_count": 1
+}
+
+def user_summary(user: dict) -> dict:
+    return {
+        "id": user["_id"],
+        "username": user["username"],
+        "displayName": user.get("displayName", user["username"]),
+        "photoURL": user.get("photoURL"),
+        "is_verified": user.get("is_verified", False),
+        "followers_count": user.get("followers_count", 0)
+    }
+
+def rank_key(summary: dict) -> tuple:
+    return (-summary["followers_count"], summary["username"].lower())
+
+class TrieNode:
+    __slots__ = ("children", "top")
+
+    def __init__(self):
+        self.children: Dict[str, "TrieNode"] = {}
+        self.top: List[tuple] = []  # (rank key, user ID), best first
+
+class UsernameTrie:
+    def __init__(self, max_users: int = MAX_INDEXED_USERS, top_k: int = NODE_TOP_K):
+        self.max_users = max_users
+        self.top_k = top_k
+        self.root = TrieNode()
+        self.users: Dict[str, dict] = {}
+
+    def _path(self, username: str):
+        node = self.root
+        for char in username.lower()[:MAX_PREFIX_LENGTH]:
+            node = node.children.setdefault(char, TrieNode())
+            yield node
+
+    def add(self, user: dict):
+        """Insert or refresh a user; new users are skipped once the trie is full"""
+        summary = user_summary(user)
+        user_id = summary["id"]
+        previous = self.users.get(user_id)
+        if previous is None and len(self.users) >= self.max_users:
+            return
+        if previous is not None and previous["username"] != summary["username"]:
+            self.remove(user_id)
+
+        self.users[user_id] = summary
+        entry = (rank_key(summary), user_id)
+        for node in self._path(summary["username"]):
+            if previous is not None:
+                node.top = [member for member in node.top if member[1] != user_id]
+            if len(node.top) < self.top_k or entry < node.top[-1]:
+                # Sorted insert into the bounded list; during a build users
+                # arrive best first, so this appends
+                insort(node.top, entry)
+                del node.top[self.top_k:]
+
+    def remove(self, user_id: str):
+        summary = self.users.pop(user_id, None)
+        if summary is None:
+            return
+        node = self.root
+        for char in summary["username"].lower()[:MAX_PREFIX_LENGTH]:
+            node = node.children.get(char)
+            if node is None:
+                return
+            node.top = [member for member in node.top if member[1] != user_id]
+
+    def lookup(self, prefix: str, limit: int) -> List[dict]:
+        node = self.root
+        for char in prefix.lower()[:MAX_PREFIX_LENGTH]:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        matches = [self.users[user_id] for _, user_id in node.top]
+        if len(prefix) > MAX_PREFIX_LENGTH:
+            matches = [user for user in matches if user["username"].lower().startswith(prefix.lower())]
+        return matches[:limit]
+
+username_trie = UsernameTrie()
+
+# Per-viewer list of followed users' summaries
+followed_users_cache = TTLCache(ttl_seconds=120, max_entries=5000)
+
+async def rebuild_username_trie():
+    """Reload the trie from the most followed users"""
+    db = get_database()
+    trie = UsernameTrie()
+    cursor = db.users.find({}, SUMMARY_PROJECTION).sort("followers_count", -1).limit(MAX_INDEXED_USERS)
+    async for user in cursor:
+        trie.add(user)
+        if len(trie.users) % BUILD_YIELD_EVERY == 0:
+            await asyncio.sleep(0)
+
+    global username_trie
+    username_trie = trie
+    return {"users_indexed": len(trie.users)}
+
+def index_user(user: dict):
+    """Add or refresh a user after register or a profile update"""
+    username_trie.add(user)
+
+def forget_followed_users(viewer_id: str):
+    """Drop the viewer's cached follow list after a follow change"""
+    followed_users_cache.invalidate(viewer_id)
+
+async def get_followed_users(viewer_id: str) -> List[dict]:
+    cached = followed_users_cache.get(viewer_id)
+    if cached is not None:
+        return cached
+
+    db = get_database()
+    following_ids = list(await follow_graph.following(viewer_id))
+
+    followed = []
+    if following_ids:
+        cursor = db.users.find({"_id": {"$in": following_ids}}, SUMMARY_PROJECTION)
+        followed = [user_summary(user) async for user in cursor]
+        followed.sort(key=rank_key)
+
+    followed_users_cache.set(viewer_id, followed)
+    return followed
+
+async def autocomplete_usernames(viewer_id: str, prefix: str, limit: int) -> List[dict]:
+    """Followed users matching the prefix first, then the most followed users"""
+    prefix = prefix.lstrip("@").lower()
+    if not prefix:
+        return []
+
+    followed = [
+        dict(user, is_following=True)
+        for user in await get_followed_users(viewer_id)
+        if user["username"].lower().startswith(prefix)
+    ][:limit]
+
+    seen = {user["id"] for user in followed} | {viewer_id}
+    popular = [
+        dict(user, is_following=False)
+        for user in username_trie.lookup(prefix, limit + len(seen))
+        if user["id"] not in seen
+    ]
+    return (followed + popular)[:limit]
+
+username_trie_rebuild_task = register_periodic_task(
+    "username_trie_rebuild",
+    REBUILD_INTERVAL_SECONDS,
+    rebuild_username_trie,
+    initial_delay=0,
+    use_lock=False
+)
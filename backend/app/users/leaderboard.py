@@ -0,0 +1,83 @@
+"""
+Precomputed trending-users leaderboards held in memory
+
+Each worker refreshes the boards on an interval and serves requests from
+memory, so the public /users/trending endpoint never queries Mongo per call.
+"""
+import hashlib
+import time
+from datetime import timedelta
+from typing import Dict, List
+from app.database import get_database
+from app.models import UserResponse
+from app.services.background import register_periodic_task
+from app.services.cache import SingleFlight
+from app.utils import get_ist_now
+
+LEADERBOARD_SIZE = 100
+REFRESH_INTERVAL_SECONDS = 5 * 60
+GROWTH_WINDOW_DAYS = 7
+
+USER_PROJECTION = {"password": 0, "search_tokens": 0}
+
+class Leaderboard:
+    def __init__(self, users: List[dict]):
+        self.users = users
+        self.refreshed_at = time.monotonic()
+        digest = hashlib.sha1()
+        for user in users:
+            digest.update(f"{user['_id']}:{user.get('followers_count', 0)}:{user.get('photoURL')};".encode())
+        self.version = digest.hexdigest()[:16]
+
+leaderboards: Dict[str, Leaderboard] = {}
+refresh_flight = SingleFlight()
+
+async def load_followers_board(db) -> List[dict]:
+    cursor = db.users.find({}, USER_PROJECTION).sort("followers_count", -1).limit(LEADERBOARD_SIZE)
+    users = await cursor.to_list(length=LEADERBOARD_SIZE)
+    return [UserResponse(**user).model_dump(by_alias=True, mode="json") for user in users]
+
+async def load_growth_board(db) -> List[dict]:
+    """Users ranked by follows gained in the last GROWTH_WINDOW_DAYS"""
+    since = get_ist_now() - timedelta(days=GROWTH_WINDOW_DAYS)
+    pipeline = [
+        {"$match": {"created_at": {"$gte": since}}},
+        {"$group": {"_id": "$following_id", "new_followers": {"$sum": 1}}},
+        {"$sort": {"new_followers": -1}},
+        {"$limit": LEADERBOARD_SIZE}
+    ]
+    growth = await db.follows.aggregate(pipeline).to_list(length=LEADERBOARD_SIZE)
+    if not growth:
+        return []
+
+    cursor = db.users.find({"_id": {"$in": [row["_id"] for row in growth]}}, USER_PROJECTION)
+    users_by_id = {user["_id"]: user async for user in cursor}
+    return [
+        UserResponse(**users_by_id[row["_id"]]).model_dump(by_alias=True, mode="json")
+        for row in growth
+        if row["_id"] in users_by_id
+    ]
+
+async def refresh_leaderboards():
+    """Recompute every board (runs on an interval in each worker)"""
+    db = get_database()
+    leaderboards["followers"] = Leaderboard(await load_followers_board(db))
+    leaderboards["growth"] = Leaderboard(await load_growth_board(db))
+    return {"users_ranked": len(leaderboards["followers"].users)}
+
+async def get_leaderboard(rank: str) -> Leaderboard:
+    """Board from memory; the first request after startup (or a stalled
+    refresh) triggers one shared load rather than one per request"""
+    board = leaderboards.get(rank)
+    if board is None or time.monotonic() - board.refreshed_at > 2 * REFRESH_INTERVAL_SECONDS:
+        await refresh_flight.do("leaderboards", refresh_leaderboards)
+        board = leaderboards[rank]
+    return board
+
+leaderboard_refresh_task = register_periodic_task(
+    "leaderboard_refresh",
+    REFRESH_INTERVAL_SECONDS,
+    lambda: refresh_flight.do("leaderboards", refresh_leaderboards),
+    initial_delay=0,
+    use_lock=False
+)
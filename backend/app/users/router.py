@@ -1,12 +1,21 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List
-from app.models import UserResponse, UserUpdate
+from fastapi import APIRouter, BackgroundTasks, HTTPException, status, Depends, Query, Request, Response
+from typing import List, Optional
+from app.models import FollowListUser, FollowRequestBatch, SuggestedUserResponse, UserResponse, UserUpdate
+from app.analytics.events import record_event
 from app.auth.dependencies import get_current_user
 from app.database import get_database
 from app.notifications.router import create_notification
+from app.pagination import encode_cursor, keyset_filter, keyset_sort
+from app.services.follow_graph import follow_graph
+from app.users.autocomplete import autocomplete_usernames, forget_followed_users, index_user
+from app.users.leaderboard import LEADERBOARD_SIZE, get_leaderboard
+from app.users.search import build_search_tokens, search_users_index
+from app.users.suggestions import SUGGESTIONS_PER_USER, get_suggestions
 from app.utils import get_ist_now
 from datetime import datetime
 from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -16,32 +25,82 @@ async def get_current_user_profile(current_user: dict = Depends(get_current_user
     return UserResponse(**current_user)
 
 @router.get("/trending", response_model=List[UserResponse])
-async def get_trending_users(limit: int = 10):
-    """Get trending users by followers count"""
-    db = get_database()
+async def get_trending_users(
+    request: Request,
+    response: Response,
+    limit: int = Query(10, ge=1, le=LEADERBOARD_SIZE),
+    rank: str = Query("followers", regex="^(followers|growth)$")
+):
+    """Get trending users by followers count or recent follower growth"""
+    board = await get_leaderboard(rank)
     
-    cursor = db.users.find().sort("followers_count", -1).limit(limit)
-    users = await cursor.to_list(length=limit)
+    etag = f'W/"{rank}-{limit}-{board.version}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
     
-    return [UserResponse(**user) for user in users]
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "public, max-age=60"
+    return board.users[:limit]
 
 @router.get("/search/{query}", response_model=List[UserResponse])
-async def search_users(query: str, limit: int = 20):
-    """Search users by username or display name"""
+async def search_users(query: str, limit: int = Query(20, ge=1, le=50)):
+    """Search users by username or display name prefix"""
+    users = await search_users_index(query, limit)
+    return [UserResponse(**user) for user in users]
+
+@router.get("/mentions/autocomplete")
+async def autocomplete_mentions(
+    q: str = Query(..., min_length=1, max_length=31),
+    limit: int = Query(8, ge=1, le=20),
+    current_user: dict = Depends(get_current_user)
+):
+    """Suggest users for @mentions: followed users first, then popular users"""
+    return await autocomplete_usernames(current_user["_id"], q, limit)
+
+@router.get("/suggestions", response_model=List[SuggestedUserResponse])
+async def get_suggested_users(
+    limit: int = Query(10, ge=1, le=SUGGESTIONS_PER_USER),
+    current_user: dict = Depends(get_current_user)
+):
+    """People you may know: precomputed friends-of-friends, then popular users"""
     db = get_database()
     
-    # Create regex pattern for case-insensitive search
-    pattern = {"$regex": query, "$options": "i"}
+    # Drop accounts followed since the suggestions were computed
+    following = await follow_graph.following(current_user["_id"])
+    suggestions = [
+        suggestion for suggestion in await get_suggestions(current_user["_id"], SUGGESTIONS_PER_USER)
+        if suggestion["user_id"] not in following
+    ][:limit]
     
-    cursor = db.users.find({
-        "$or": [
-            {"username": pattern},
-            {"displayName": pattern}
-        ]
-    }).limit(limit)
+    cursor = db.users.find(
+        {"_id": {"$in": [suggestion["user_id"] for suggestion in suggestions]}},
+        {"password": 0, "search_tokens": 0}
+    )
+    users_by_id = {user["_id"]: user async for user in cursor}
+    result = [
+        SuggestedUserResponse(**users_by_id[suggestion["user_id"]], mutual_count=suggestion["mutual_count"])
+        for suggestion in suggestions
+        if suggestion["user_id"] in users_by_id
+    ]
+    
+    # New users without a graph yet get the most followed accounts
+    if len(result) < limit:
+        seen = {user.id for user in result} | {current_user["_id"]}
+        blocks = db.blocks.find(
+            {"$or": [{"blocker_id": current_user["_id"]}, {"blocked_id": current_user["_id"]}]},
+            {"blocker_id": 1, "blocked_id": 1}
+        )
+        async for block in blocks:
+            seen.update((block["blocker_id"], block["blocked_id"]))
+        
+        board = await get_leaderboard("followers")
+        result += [
+            SuggestedUserResponse(**user)
+            for user in board.users
+            if user["_id"] not in seen and user["_id"] not in following
+        ][:limit - len(result)]
     
-    users = await cursor.to_list(length=limit)
-    return [UserResponse(**user) for user in users]
+    return result
 
 @router.get("/{user_id}", response_model=UserResponse)
 async def get_user_profile(user_id: str):
@@ -68,6 +127,7 @@ async def update_user_profile(
     update_data = {}
     if user_update.displayName is not None:
         update_data["displayName"] = user_update.displayName
+        update_data["search_tokens"] = build_search_tokens(current_user["username"], user_update.displayName)
     if user_update.bio is not None:
         update_data["bio"] = user_update.bio
     if user_update.photoURL is not None:
@@ -97,6 +157,8 @@ async def update_user_profile(
     
     # Get updated user
     updated_user = await db.users.find_one({"_id": current_user["_id"]})
+    if update_data:
+        index_user(updated_user)
     
     # Convert ObjectId to string
     if "_id" in updated_user and isinstance(updated_user["_id"], ObjectId):
@@ -104,9 +166,44 @@ async def update_user_profile(
     
     return UserResponse.model_validate(updated_user)
 
+def follow_counter_updates(follower_id: str, following_id: str, delta: int) -> list:
+    """users bulk_write operations adjusting both sides of a follow edge"""
+    return [
+        UpdateOne({"_id": follower_id}, {"$inc": {"following_count": delta}}),
+        UpdateOne({"_id": following_id}, {"$inc": {"followers_count": delta}})
+    ]
+
+async def load_follow_state(db, follower_id: str, target_id: str) -> Optional[dict]:
+    """Target's privacy plus any existing follow / pending request, in one query"""
+    pipeline = [
+        {"$match": {"_id": target_id}},
+        {"$project": {"is_private": 1}},
+        {"$lookup": {
+            "from": "follows",
+            "pipeline": [
+                {"$match": {"follower_id": follower_id, "following_id": target_id}},
+                {"$limit": 1},
+                {"$project": {"_id": 1}}
+            ],
+            "as": "follow"
+        }},
+        {"$lookup": {
+            "from": "follow_requests",
+            "pipeline": [
+                {"$match": {"requester_id": follower_id, "target_id": target_id, "status": "pending"}},
+                {"$limit": 1},
+                {"$project": {"_id": 1}}
+            ],
+            "as": "request"
+        }}
+    ]
+    result = await db.users.aggregate(pipeline).to_list(length=1)
+    return result[0] if result else None
+
 @router.post("/follow/{user_id}")
 async def toggle_follow_user(
     user_id: str,
+    background_tasks: BackgroundTasks,
     current_user: dict = Depends(get_current_user)
 ):
     """Follow or unfollow a user (creates follow request for private accounts)"""
@@ -118,47 +215,29 @@ async def toggle_follow_user(
             detail="Cannot follow yourself"
         )
     
-    # Check if target user exists
-    target_user = await db.users.find_one({"_id": user_id})
+    # Target user, existing follow and pending request in one round trip
+    target_user = await load_follow_state(db, current_user["_id"], user_id)
     if not target_user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    # Check if already following
-    existing_follow = await db.follows.find_one({
-        "follower_id": current_user["_id"],
-        "following_id": user_id
-    })
-    
-    # Check if there's a pending follow request
-    existing_request = await db.follow_requests.find_one({
-        "requester_id": current_user["_id"],
-        "target_id": user_id,
-        "status": "pending"
-    })
-    
-    if existing_follow:
-        # Unfollow
-        await db.follows.delete_one({
+    if target_user["follow"]:
+        # Unfollow; only the request that actually deletes the row adjusts counters
+        result = await db.follows.delete_one({
             "follower_id": current_user["_id"],
             "following_id": user_id
         })
+        if result.deleted_count:
+            await db.users.bulk_write(follow_counter_updates(current_user["_id"], user_id, -1))
         
-        # Update counters
-        await db.users.update_one(
-            {"_id": current_user["_id"]},
-            {"$inc": {"following_count": -1}}
-        )
-        await db.users.update_one(
-            {"_id": user_id},
-            {"$inc": {"followers_count": -1}}
-        )
+        follow_graph.remove_edge(current_user["_id"], user_id)
+        forget_followed_users(current_user["_id"])
         
         return {"following": False, "requested": False, "message": "Unfollowed user"}
     
-    elif existing_request:
+    elif target_user["request"]:
         # Cancel follow request
         await db.follow_requests.delete_one({
             "requester_id": current_user["_id"],
@@ -168,55 +247,59 @@ async def toggle_follow_user(
         
         return {"following": False, "requested": False, "message": "Follow request cancelled"}
     
-    else:
-        # Check if target account is private
-        if target_user.get("is_private", False):
-            # Create follow request instead of following directly
-            request_id = str(ObjectId())
+    elif target_user.get("is_private", False):
+        # Create follow request instead of following directly;
+        # the partial unique index rejects a duplicate pending request
+        try:
             await db.follow_requests.insert_one({
-                "_id": request_id,
+                "_id": str(ObjectId()),
                 "requester_id": current_user["_id"],
                 "target_id": user_id,
                 "status": "pending",
                 "created_at": get_ist_now()
             })
-            
-            # Create notification for follow request
-            await create_notification(
-                db=db,
-                recipient_id=user_id,
-                notification_type="follow_request",
-                actor_id=current_user["_id"]
-            )
-            
-            return {"following": False, "requested": True, "message": "Follow request sent"}
-        else:
-            # Follow directly (public account)
+        except DuplicateKeyError:
+            return {"following": False, "requested": True, "message": "Follow request already sent"}
+        
+        # Notify after the response is sent
+        background_tasks.add_task(
+            create_notification,
+            db=db,
+            recipient_id=user_id,
+            notification_type="follow_request",
+            actor_id=current_user["_id"]
+        )
+        
+        return {"following": False, "requested": True, "message": "Follow request sent"}
+    
+    else:
+        # Follow directly (public account); the unique (follower_id, following_id)
+        # index makes a concurrent duplicate follow fail before counters move
+        try:
             await db.follows.insert_one({
                 "follower_id": current_user["_id"],
                 "following_id": user_id,
                 "created_at": get_ist_now()
             })
-            
-            # Update counters
-            await db.users.update_one(
-                {"_id": current_user["_id"]},
-                {"$inc": {"following_count": 1}}
-            )
-            await db.users.update_one(
-                {"_id": user_id},
-                {"$inc": {"followers_count": 1}}
-            )
-            
-            # Create notification for followed user
-            await create_notification(
-                db=db,
-                recipient_id=user_id,
-                notification_type="follow",
-                actor_id=current_user["_id"]
-            )
-            
-            return {"following": True, "requested": False, "message": "Followed user"}
+        except DuplicateKeyError:
+            return {"following": True, "requested": False, "message": "Already following user"}
+        
+        await db.users.bulk_write(follow_counter_updates(current_user["_id"], user_id, 1))
+        record_event("follow", user_id, current_user["_id"])
+        
+        follow_graph.add_edge(current_user["_id"], user_id)
+        forget_followed_users(current_user["_id"])
+        
+        # Notify after the response is sent
+        background_tasks.add_task(
+            create_notification,
+            db=db,
+            recipient_id=user_id,
+            notification_type="follow",
+            actor_id=current_user["_id"]
+        )
+        
+        return {"following": True, "requested": False, "message": "Followed user"}
 
 @router.get("/{user_id}/following", response_model=bool)
 async def is_following_user(
@@ -262,27 +345,90 @@ async def get_follow_status(
     
     return {"following": False, "requested": False}
 
+def follow_request_ids(request_ids: List[str]) -> list:
+    """Match request IDs stored either as strings or as legacy ObjectIds"""
+    ids = []
+    for request_id in request_ids:
+        ids.append(request_id)
+        if ObjectId.is_valid(request_id):
+            ids.append(ObjectId(request_id))
+    return ids
+
+async def accept_requests(db, target_id: str, requests: List[dict]) -> List[str]:
+    """Create follows for accepted requests with bulk writes; returns requester IDs"""
+    requester_ids = [request["requester_id"] for request in requests]
+    now = get_ist_now()
+    
+    # Unordered insert; rows rejected by the unique index are existing follows
+    try:
+        await db.follows.insert_many([{
+            "follower_id": requester_id,
+            "following_id": target_id,
+            "created_at": now
+        } for requester_id in requester_ids], ordered=False)
+        new_followers = requester_ids
+    except BulkWriteError as e:
+        failed = {error["index"] for error in e.details.get("writeErrors", []) if error.get("code") == 11000}
+        if len(failed) != len(e.details.get("writeErrors", [])):
+            raise
+        new_followers = [requester_id for index, requester_id in enumerate(requester_ids) if index not in failed]
+    
+    # One counter write per requester plus a single one for the target
+    if new_followers:
+        operations = [
+            UpdateOne({"_id": requester_id}, {"$inc": {"following_count": 1}})
+            for requester_id in new_followers
+        ]
+        operations.append(UpdateOne({"_id": target_id}, {"$inc": {"followers_count": len(new_followers)}}))
+        await db.users.bulk_write(operations, ordered=False)
+        for requester_id in new_followers:
+            record_event("follow", target_id, requester_id)
+    
+    await db.follow_requests.update_many(
+        {"_id": {"$in": [request["_id"] for request in requests]}},
+        {"$set": {"status": "accepted", "updated_at": now}}
+    )
+    
+    for requester_id in requester_ids:
+        follow_graph.add_edge(requester_id, target_id)
+        forget_followed_users(requester_id)
+    
+    return requester_ids
+
 @router.get("/follow-requests/pending")
 async def get_pending_follow_requests(
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(20, ge=1, le=100),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get pending follow requests for current user"""
+    """Get pending follow requests for current user, newest first, one page at a time"""
     db = get_database()
     
-    cursor = db.follow_requests.find({
-        "target_id": current_user["_id"],
-        "status": "pending"
-    }).sort("created_at", -1)
+    # Keyset pagination on (target_id, status, created_at, _id)
+    query_filter = {"target_id": current_user["_id"], "status": "pending"}
+    if cursor:
+        query_filter.update(keyset_filter("created_at", cursor))
+    
+    requests_cursor = db.follow_requests.find(query_filter).sort(keyset_sort("created_at")).limit(limit + 1)
+    requests = await requests_cursor.to_list(length=limit + 1)
     
-    requests = await cursor.to_list(length=100)
+    has_more = len(requests) > limit
+    requests = requests[:limit]
+    
+    # Requester profiles in one query
+    requester_ids = list({req["requester_id"] for req in requests})
+    users_cursor = db.users.find(
+        {"_id": {"$in": requester_ids}},
+        {"username": 1, "displayName": 1, "photoURL": 1}
+    )
+    requesters = {user["_id"]: user async for user in users_cursor}
     
-    # Get requester details
     result = []
     for req in requests:
-        requester = await db.users.find_one({"_id": req["requester_id"]})
+        requester = requesters.get(req["requester_id"])
         if requester:
             result.append({
-                "request_id": str(req["_id"]) if isinstance(req["_id"], ObjectId) else req["_id"],
+                "request_id": str(req["_id"]),
                 "requester_id": req["requester_id"],
                 "username": requester["username"],
                 "displayName": requester["displayName"],
@@ -290,7 +436,53 @@ async def get_pending_follow_requests(
                 "created_at": req["created_at"]
             })
     
-    return result
+    return {
+        "requests": result,
+        "has_more": has_more,
+        "next_cursor": encode_cursor(requests[-1]["created_at"], requests[-1]["_id"]) if has_more else None
+    }
+
+@router.post("/follow-requests/bulk")
+async def respond_to_follow_requests(
+    batch: FollowRequestBatch,
+    background_tasks: BackgroundTasks,
+    current_user: dict = Depends(get_current_user)
+):
+    """Accept or reject many pending follow requests at once"""
+    db = get_database()
+    
+    cursor = db.follow_requests.find({
+        "_id": {"$in": follow_request_ids(batch.request_ids)},
+        "target_id": current_user["_id"],
+        "status": "pending"
+    }, {"requester_id": 1})
+    requests = await cursor.to_list(length=len(batch.request_ids))
+    
+    if batch.action == "reject":
+        if requests:
+            await db.follow_requests.update_many(
+                {"_id": {"$in": [request["_id"] for request in requests]}},
+                {"$set": {"status": "rejected", "updated_at": get_ist_now()}}
+            )
+    elif requests:
+        requester_ids = await accept_requests(db, current_user["_id"], requests)
+        
+        # Notify requesters after the response is sent
+        for requester_id in requester_ids:
+            background_tasks.add_task(
+                create_notification,
+                db=db,
+                recipient_id=requester_id,
+                notification_type="follow_accepted",
+                actor_id=current_user["_id"]
+            )
+    
+    processed_ids = {str(request["_id"]) for request in requests}
+    return {
+        "action": batch.action,
+        "processed": len(processed_ids),
+        "not_found": [request_id for request_id in batch.request_ids if request_id not in processed_ids]
+    }
 
 @router.post("/follow-requests/{request_id}/accept")
 async def accept_follow_request(
@@ -330,29 +522,8 @@ async def accept_follow_request(
             detail=f"Follow request not found for id: {request_id}"
         )
     
-    # Create follow relationship
-    await db.follows.insert_one({
-        "follower_id": request["requester_id"],
-        "following_id": current_user["_id"],
-        "created_at": get_ist_now()
-    })
-    
-    # Update counters
-    await db.users.update_one(
-        {"_id": request["requester_id"]},
-        {"$inc": {"following_count": 1}}
-    )
-    await db.users.update_one(
-        {"_id": current_user["_id"]},
-        {"$inc": {"followers_count": 1}}
-    )
-    
-    # Update request status - use the same ID format that worked for finding
-    update_id = request["_id"]
-    await db.follow_requests.update_one(
-        {"_id": update_id},
-        {"$set": {"status": "accepted", "updated_at": get_ist_now()}}
-    )
+    # Create follow relationship, update counters and mark the request accepted
+    await accept_requests(db, current_user["_id"], [request])
     
     # Create notification for requester
     await create_notification(
@@ -406,26 +577,78 @@ async def reject_follow_request(
     
     return {"message": "Follow request rejected"}
 
-@router.get("/{user_id}/following-list", response_model=List[UserResponse])
+async def follow_list_page(
+    db,
+    edge_field: str,
+    user_field: str,
+    user_id: str,
+    cursor: Optional[str],
+    limit: int,
+    viewer_id: Optional[str]
+) -> dict:
+    """One page of follows for user_id, newest first, with hydrated profiles.
+
+    edge_field selects the side of the edge matching user_id ("follower_id"
+    for the following list, "following_id" for followers); user_field is the
+    other side, whose profiles are returned.
+    """
+    # Keyset pagination on (edge_field, created_at, _id)
+    query_filter = {edge_field: user_id}
+    if cursor:
+        query_filter.update(keyset_filter("created_at", cursor))
+    
+    follows_cursor = db.follows.find(
+        query_filter, {user_field: 1, "created_at": 1}
+    ).sort(keyset_sort("created_at")).limit(limit + 1)
+    follows = await follows_cursor.to_list(length=limit + 1)
+    
+    has_more = len(follows) > limit
+    follows = follows[:limit]
+    
+    # Profiles in one query, then put back in follows order
+    user_ids = [follow[user_field] for follow in follows]
+    users_cursor = db.users.find({"_id": {"$in": user_ids}}, {"password": 0, "search_tokens": 0})
+    users_by_id = {user["_id"]: user async for user in users_cursor}
+    
+    viewer_following = await follow_graph.following(viewer_id) if viewer_id else None
+    
+    users = []
+    for listed_id in user_ids:
+        user = users_by_id.get(listed_id)
+        if user:
+            users.append(FollowListUser(
+                **user,
+                is_following=listed_id in viewer_following if viewer_following is not None else None
+            ))
+    
+    return {
+        "users": users,
+        "has_more": has_more,
+        "next_cursor": encode_cursor(follows[-1]["created_at"], follows[-1]["_id"]) if has_more else None
+    }
+
+@router.get("/{user_id}/following-list")
 async def get_user_following_list(
     user_id: str,
-    limit: int = 50,
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(50, ge=1, le=100),
+    include_follow_state: bool = Query(False, description="Add whether the current user follows each user"),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get list of users that the specified user is following"""
+    """Get users that the specified user is following, most recent first"""
     db = get_database()
-    
-    # Get following IDs
-    cursor = db.follows.find({"follower_id": user_id}).limit(limit)
-    follows = await cursor.to_list(length=limit)
-    
-    if not follows:
-        return []
-    
-    following_ids = [follow["following_id"] for follow in follows]
-    
-    # Get user details
-    cursor = db.users.find({"_id": {"$in": following_ids}})
-    users = await cursor.to_list(length=len(following_ids))
-    
-    return [UserResponse(**user) for user in users]
\ No newline at end of file
+    viewer_id = current_user["_id"] if include_follow_state else None
+    return await follow_list_page(db, "follower_id", "following_id", user_id, cursor, limit, viewer_id)
+
+@router.get("/{user_id}/followers-list")
+async def get_user_followers_list(
+    user_id: str,
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(50, ge=1, le=100),
+    include_follow_state: bool = Query(False, description="Add whether the current user follows each user"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get users following the specified user, most recent first"""
+    db = get_database()
+    viewer_id = current_user["_id"] if include_follow_state else None
+    return await follow_list_page(db, "following_id", "follower_id", user_id, cursor, limit, viewer_id)
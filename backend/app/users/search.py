@@ -0,0 +1,131 @@
+"""
+Prefix search index for users
+
+Each user document carries `search_tokens`: the lowercase prefixes (edge
+n-grams) of the username and of every word in the display name. A multikey
+index on (search_tokens, followers_count) turns search into an equality
+lookup whose cost does not grow with the size of the users collection.
+Exact username matches are looked up separately, so they are never cut from
+the popularity-ordered candidates.
+"""
+import re
+from typing import List
+from pymongo import UpdateOne
+from app.database import get_database
+from app.services.background import backfill_completed, mark_backfill_completed, register_periodic_task
+
+MAX_TOKEN_LENGTH = 20
+# Candidates fetched per query before ranking by match quality
+CANDIDATE_MULTIPLIER = 5
+BACKFILL_BATCH_SIZE = 500
+BACKFILL_INTERVAL_SECONDS = 60 * 60
+# Case-insensitive username comparison; the users_username_ci index uses it
+USERNAME_COLLATION = {"locale": "en", "strength": 2}
+
+WORD_SPLIT = re.compile(r"[\s_.\-]+")
+
+def normalize(text: str) -> str:
+    return (text or "").strip().lower()
+
+def edge_ngrams(word: str) -> List[str]:
+    """All prefixes of a word, up to MAX_TOKEN_LENGTH characters"""
+    return [word[:length] for length in range(1, min(len(word), MAX_TOKEN_LENGTH) + 1)]
+
+def build_search_tokens(username: str, display_name: str) -> List[str]:
+    """Tokens stored on the user document for prefix search"""
+    words = [normalize(username)]
+    words += [word for word in WORD_SPLIT.split(normalize(display_name)) if word]
+    # The username split into parts ("jane_doe" -> "doe") is searchable too
+    words += [word for word in WORD_SPLIT.split(normalize(username)) if word]
+
+    tokens = []
+    for word in words:
+        tokens.extend(edge_ngrams(word))
+    return list(dict.fromkeys(tokens))
+
+def match_rank(user: dict, query: str) -> int:
+    """Lower is better: exact username, username prefix, display name prefix, word prefix"""
+    username = normalize(user.get("username"))
+    display_name = normalize(user.get("displayName"))
+    if username == query:
+        return 0
+    if username.startswith(query):
+        return 1
+    if display_name.startswith(query):
+        return 2
+    return 3
+
+async def search_users_index(query: str, limit: int) -> List[dict]:
+    """Users matching every word of the query by prefix, best matches first"""
+    query = normalize(query)
+    words = [word for word in WORD_SPLIT.split(query) if word]
+    if not words:
+        return []
+
+    tokens = [word[:MAX_TOKEN_LENGTH] for word in words]
+    db = get_database()
+    projection = {"password": 0, "search_tokens": 0}
+
+    # An exact username is the best match however few followers it has
+    exact = []
+    if len(words) == 1:
+        cursor = db.users.find({"username": query}, projection).collation(USERNAME_COLLATION).limit(limit)
+        exact = await cursor.to_list(length=limit)
+
+    cursor = db.users.find(
+        {"search_tokens": {"$all": tokens}}, projection
+    ).sort("followers_count", -1).limit(limit * CANDIDATE_MULTIPLIER)
+    exact_ids = {user["_id"] for user in exact}
+    candidates = exact + [
+        user for user in await cursor.to_list(length=limit * CANDIDATE_MULTIPLIER)
+        if user["_id"] not in exact_ids
+    ]
+
+    candidates.sort(key=lambda user: (
+        match_rank(user, query),
+        -user.get("followers_count", 0),
+        user.get("username", "")
+    ))
+    return candidates[:limit]
+
+async def backfill_search_tokens():
+    """Add search_tokens to users created before the search index existed.
+    
+    Register sets the tokens, so once a run finds no users without them the
+    backfill is recorded as complete and later runs skip the users scan.
+    """
+    if await backfill_completed("search_tokens"):
+        return {"users_indexed": 0}
+    
+    db = get_database()
+    updated = 0
+    while True:
+        cursor = db.users.find(
+            {"search_tokens": {"$exists": False}},
+            {"username": 1, "displayName": 1}
+        ).limit(BACKFILL_BATCH_SIZE)
+        users = await cursor.to_list(length=BACKFILL_BATCH_SIZE)
+        if not users:
+            break
+
+        await db.users.bulk_write([
+            UpdateOne(
+                {"_id": user["_id"]},
+                {"$set": {"search_tokens": build_search_tokens(user["username"], user.get("displayName"))}}
+            )
+            for user in users
+        ], ordered=False)
+        updated += len(users)
+
+        if len(users) < BACKFILL_BATCH_SIZE:
+            break
+
+    await mark_backfill_completed("search_tokens")
+    return {"users_indexed": updated}
+
+user_search_backfill_task = register_periodic_task(
+    "user_search_backfill",
+    BACKFILL_INTERVAL_SECONDS,
+    backfill_search_tokens,
+    initial_delay=30
+)
@@ -0,0 +1,259 @@
+"""
+Offline "people you may know" suggestions from the follows graph
+
+Candidates are friends of friends: accounts followed by the people a user
+follows, scored by how many of them follow the candidate (mutual count) plus
+a damped popularity term. This is the row-by-row product of the follows
+adjacency matrix with itself, computed for CHUNK_SIZE source users at a time
+and streaming the second hop in slices of INTERMEDIATE_BATCH_SIZE users, so
+memory stays bounded by the chunk rather than by the number of edges. The
+second hop is capped too: at most MAX_INTERMEDIATES per chunk, and only the
+MAX_SECOND_HOP_EDGES most recent follows of each, so an intermediate who
+follows thousands of accounts costs no more than any other.
+
+Results are stored per user in `user_suggestions` and served as-is by
+/users/suggestions. Users whose graph changed are refreshed every few
+minutes; a slower full pass walks every user in _id order.
+"""
+import asyncio
+import math
+from collections import Counter, defaultdict
+from datetime import timedelta
+from typing import Dict, List, Optional, Set
+from pymongo import UpdateOne
+from app.database import get_database
+from app.services.background import register_periodic_task
+from app.utils import get_ist_now
+
+SUGGESTIONS_PER_USER = 30
+CHUNK_SIZE = 100
+INTERMEDIATE_BATCH_SIZE = 1000
+# Only the most recent follows of each user are expanded, which bounds the
+# second hop for accounts that follow thousands of people
+MAX_EXPANDED_FOLLOWS = 200
+# Second-hop bounds per chunk: intermediates expanded, and follows read per
+# intermediate (most recent first)
+MAX_INTERMEDIATES = 5000
+MAX_SECOND_HOP_EDGES = 200
+POPULARITY_WEIGHT = 0.5
+
+CHANGED_REFRESH_INTERVAL_SECONDS = 5 * 60
+CHANGED_REFRESH_MAX_CHANGES = 5000
+FULL_REFRESH_INTERVAL_SECONDS = 10 * 60
+FULL_REFRESH_CHUNKS_PER_RUN = 5
+CHUNK_PAUSE_SECONDS = 0.5
+
+async def load_exclusions(db, user_ids: List[str]) -> tuple:
+    """Per-user IDs that must not be suggested, plus each user's expanded follows"""
+    excluded: Dict[str, Set[str]] = {user_id: {user_id} for user_id in user_ids}
+    expanded: Dict[str, List[str]] = defaultdict(list)
+
+    cursor = db.follows.find(
+        {"follower_id": {"$in": user_ids}},
+        {"follower_id": 1, "following_id": 1, "_id": 0}
+    ).sort("created_at", -1)
+    async for follow in cursor:
+        excluded[follow["follower_id"]].add(follow["following_id"])
+        if len(expanded[follow["follower_id"]]) < MAX_EXPANDED_FOLLOWS:
+            expanded[follow["follower_id"]].append(follow["following_id"])
+
+    # Blocks in either direction
+    cursor = db.blocks.find(
+        {"$or": [{"blocker_id": {"$in": user_ids}}, {"blocked_id": {"$in": user_ids}}]},
+        {"blocker_id": 1, "blocked_id": 1, "_id": 0}
+    )
+    async for block in cursor:
+        if block["blocker_id"] in excluded:
+            excluded[block["blocker_id"]].add(block["blocked_id"])
+        if block["blocked_id"] in excluded:
+            excluded[block["blocked_id"]].add(block["blocker_id"])
+
+    # Accounts already requested
+    cursor = db.follow_requests.find(
+        {"requester_id": {"$in": user_ids}, "status": "pending"},
+        {"requester_id": 1, "target_id": 1, "_id": 0}
+    )
+    async for request in cursor:
+        excluded[request["requester_id"]].add(request["target_id"])
+
+    return excluded, expanded
+
+async def compute_suggestions(db, user_ids: List[str]) -> Dict[str, List[dict]]:
+    """Scored suggestions for a chunk of users"""
+    excluded, expanded = await load_exclusions(db, user_ids)
+
+    # Reverse index: intermediate user -> chunk users who follow them
+    followed_by: Dict[str, List[str]] = defaultdict(list)
+    for user_id, following in expanded.items():
+        for intermediate_id in following:
+            followed_by[intermediate_id].append(user_id)
+
+    # Second hop, from the intermediates shared by the most chunk users
+    mutuals: Dict[str, Counter] = {user_id: Counter() for user_id in user_ids}
+    intermediates = sorted(followed_by, key=lambda user_id: len(followed_by[user_id]), reverse=True)
+    intermediates = intermediates[:MAX_INTERMEDIATES]
+
+    def count_follow(intermediate_id: str, candidate_id: str):
+        for user_id in followed_by[intermediate_id]:
+            if candidate_id not in excluded[user_id]:
+                mutuals[user_id][candidate_id] += 1
+
+    for start in range(0, len(intermediates), INTERMEDIATE_BATCH_SIZE):
+        if start:
+            await asyncio.sleep(0)
+        batch = intermediates[start:start + INTERMEDIATE_BATCH_SIZE]
+        cursor = db.users.find({"_id": {"$in": batch}}, {"following_count": 1})
+        following_counts = {user["_id"]: user.get("following_count", 0) async for user in cursor}
+
+        # Light intermediates in one query, still capped per intermediate in
+        # case a following_count is stale
+        light = [user_id for user_id in batch if following_counts.get(user_id, 0) <= MAX_SECOND_HOP_EDGES]
+        if light:
+            pipeline = [
+                {"$match": {"follower_id": {"$in": light}}},
+                {"$sort": {"follower_id": 1, "created_at": -1}},
+                {"$group": {"_id": "$follower_id", "following_ids": {"$push": "$following_id"}}},
+                {"$project": {"following_ids": {"$slice": ["$following_ids", MAX_SECOND_HOP_EDGES]}}}
+            ]
+            async for entry in db.follows.aggregate(pipeline, allowDiskUse=True):
+                for following_id in entry["following_ids"]:
+                    count_follow(entry["_id"], following_id)
+
+        # Heavy intermediates one at a time, most recent follows only
+        for user_id in batch:
+            if following_counts.get(user_id, 0) > MAX_SECOND_HOP_EDGES:
+                cursor = db.follows.find(
+                    {"follower_id": user_id},
+                    {"follower_id": 1, "following_id": 1, "_id": 0}
+                ).sort("created_at", -1).limit(MAX_SECOND_HOP_EDGES)
+                async for follow in cursor:
+                    count_follow(user_id, follow["following_id"])
+
+    # Shortlist by mutual count, then rank with popularity
+    shortlists = {
+        user_id: counter.most_common(SUGGESTIONS_PER_USER * 3)
+        for user_id, counter in mutuals.items()
+    }
+    candidate_ids = list({candidate_id for shortlist in shortlists.values() for candidate_id, _ in shortlist})
+    followers = {}
+    if candidate_ids:
+        cursor = db.users.find({"_id": {"$in": candidate_ids}}, {"followers_count": 1})
+        followers = {user["_id"]: user.get("followers_count", 0) async for user in cursor}
+
+    results = {}
+    for user_id, shortlist in shortlists.items():
+        scored = [
+            {
+                "user_id": candidate_id,
+                "mutual_count": mutual_count,
+                "score": round(mutual_count + POPULARITY_WEIGHT * math.log1p(followers[candidate_id]), 3)
+            }
+            for candidate_id, mutual_count in shortlist
+            if candidate_id in followers  # Skip deleted accounts
+        ]
+        scored.sort(key=lambda suggestion: suggestion["score"], reverse=True)
+        results[user_id] = scored[:SUGGESTIONS_PER_USER]
+    return results
+
+async def refresh_suggestions_for(db, user_ids: List[str]) -> int:
+    """Recompute and store suggestions for the given users, a chunk at a time"""
+    refreshed = 0
+    for start in range(0, len(user_ids), CHUNK_SIZE):
+        if start:
+            await asyncio.sleep(CHUNK_PAUSE_SECONDS)
+        results = await compute_suggestions(db, user_ids[start:start + CHUNK_SIZE])
+        now = get_ist_now()
+        await db.user_suggestions.bulk_write([
+            UpdateOne(
+                {"_id": user_id},
+                {"$set": {"suggestions": suggestions, "computed_at": now}},
+                upsert=True
+            )
+            for user_id, suggestions in results.items()
+        ], ordered=False)
+        refreshed += len(results)
+    return refreshed
+
+async def refresh_changed_suggestions():
+    """Refresh users who followed someone, blocked or were blocked, or signed
+    up since the previous run"""
+    db = get_database()
+    checkpoint = await db.job_checkpoints.find_one({"_id": "suggestions:changed"}) or {}
+    until = get_ist_now()
+    since = checkpoint.get("last_run_at") or until - timedelta(seconds=CHANGED_REFRESH_INTERVAL_SECONDS)
+
+    # Each source is read oldest first up to the cap. When one is cut
+    # short, this run stops at its last change and the next run resumes there.
+    sources = [
+        (db.follows, {"follower_id": 1, "created_at": 1, "_id": 0}, ("follower_id",)),
+        (db.blocks, {"blocker_id": 1, "blocked_id": 1, "created_at": 1, "_id": 0}, ("blocker_id", "blocked_id")),
+        (db.users, {"_id": 1, "created_at": 1}, ("_id",))
+    ]
+    changes = []
+    cutoff = None  # Set from stored timestamps, so it compares with them
+    for collection, projection, fields in sources:
+        cursor = collection.find(
+            {"created_at": {"$gte": since, "$lt": cutoff or until}}, projection
+        ).sort("created_at", 1).limit(CHANGED_REFRESH_MAX_CHANGES)
+        docs = await cursor.to_list(length=CHANGED_REFRESH_MAX_CHANGES)
+        if len(docs) == CHANGED_REFRESH_MAX_CHANGES:
+            cutoff = docs[-1]["created_at"] if cutoff is None else min(cutoff, docs[-1]["created_at"])
+        changes.append((docs, fields))
+
+    changed: Set[str] = {
+        doc[field]
+        for docs, fields in changes
+        for doc in docs
+        if cutoff is None or doc["created_at"] < cutoff
+        for field in fields
+    }
+
+    refreshed = await refresh_suggestions_for(db, sorted(changed))
+    await db.job_checkpoints.update_one(
+        {"_id": "suggestions:changed"},
+        {"$set": {"last_run_at": cutoff or until}},
+        upsert=True
+    )
+    return {"users_refreshed": refreshed}
+
+async def refresh_all_suggestions():
+    """Advance the full pass over users by a few chunks"""
+    db = get_database()
+    checkpoint = await db.job_checkpoints.find_one({"_id": "suggestions:full"}) or {}
+    after: Optional[str] = checkpoint.get("last_id")
+
+    batch_size = CHUNK_SIZE * FULL_REFRESH_CHUNKS_PER_RUN
+    query = {"_id": {"$gt": after}} if after else {}
+    cursor = db.users.find(query, {"_id": 1}).sort("_id", 1).limit(batch_size)
+    user_ids = [user["_id"] async for user in cursor]
+
+    refreshed = await refresh_suggestions_for(db, user_ids)
+
+    update = {"$set": {
+        "last_id": user_ids[-1] if len(user_ids) == batch_size else None,
+        "updated_at": get_ist_now()
+    }}
+    if len(user_ids) < batch_size:
+        update["$inc"] = {"passes": 1}
+    await db.job_checkpoints.update_one({"_id": "suggestions:full"}, update, upsert=True)
+    return {"users_refreshed": refreshed}
+
+async def get_suggestions(user_id: str, limit: int) -> List[dict]:
+    """Stored suggestions for a user, best first"""
+    db = get_database()
+    entry = await db.user_suggestions.find_one({"_id": user_id}, {"suggestions": 1})
+    return (entry or {}).get("suggestions", [])[:limit]
+
+suggestions_changed_task = register_periodic_task(
+    "suggestions_changed_refresh",
+    CHANGED_REFRESH_INTERVAL_SECONDS,
+    refresh_changed_suggestions,
+    initial_delay=90
+)
+
+suggestions_full_task = register_periodic_task(
+    "suggestions_full_refresh",
+    FULL_REFRESH_INTERVAL_SECONDS,
+    refresh_all_suggestions,
+    initial_delay=120
+)
@@ -1,8 +1,12 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from app.database import connect_to_mongo, close_mongo_connection
 from app.database_indexes import create_indexes
+from app.services.background import start_periodic_tasks, stop_periodic_tasks
+from app.services import counter_reconciler  # registers the counter reconciliation job
+from app.services.metrics import MetricsMiddleware, render_metrics
 from app.auth.router import router as auth_router
 from app.users.router import router as users_router
 from app.posts.router import router as posts_router
@@ -12,14 +16,17 @@ from app.notifications.router import router as notifications_router
 from app.stories.router import router as stories_router
 from app.hashtags.router import router as hashtags_router
 from app.moderation.router import router as moderation_router
+from app.analytics.router import router as analytics_router
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await connect_to_mongo()
     await create_indexes()  # Create database indexes
+    start_periodic_tasks()  # Story cleanup and other scheduled jobs
     yield
     # Shutdown
+    await stop_periodic_tasks()
     await close_mongo_connection()
 
 app = FastAPI(
@@ -38,6 +45,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request timing and per-request MongoDB usage, outermost so it sees everything
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(auth_router)
 app.include_router(users_router)
@@ -48,11 +58,17 @@ app.include_router(notifications_router)
 app.include_router(stories_router)
 app.include_router(hashtags_router)
 app.include_router(moderation_router)
+app.include_router(analytics_router)
 
 @app.get("/")
 async def root():
     return {"message": "Vois Social Media API with MongoDB", "docs": "/docs"}
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Prometheus metrics for this worker"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
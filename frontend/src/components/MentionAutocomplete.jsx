@@ -1,6 +1,6 @@
 import { useState, useEffect, useRef } from 'react';
 import { User } from 'lucide-react';
-import { searchUsers } from '../services/users.service';
+import { autocompleteMentions } from '../services/users.service';
 
 export default function MentionAutocomplete({ 
   value, 
@@ -47,7 +47,7 @@ export default function MentionAutocomplete({
           if (searchTerm.length > 0) {
             try {
               console.log('MentionAutocomplete: searching users for', searchTerm);
-              const users = await searchUsers(searchTerm, 10);
+              const users = await autocompleteMentions(searchTerm, 10);
               console.log('MentionAutocomplete: found users', users);
               setSuggestions(users);
               setSelectedIndex(0);
@@ -8,7 +8,8 @@ const ROSE_GRADIENT = "bg-gradient-to-r from-[#e93e68] to-[#f45d7d]";
 export default function NestedComment({ comment, onDelete, onEdit, onReply, level = 0 }) {
   const { userProfile } = useAuth();
   const [showReplies, setShowReplies] = useState(false);
-  const [replies, setReplies] = useState([]);
+  // Replies below the first level arrive nested in the thread response
+  const [replies, setReplies] = useState(comment.replies || []);
   const [loadingReplies, setLoadingReplies] = useState(false);
   const [showReplyForm, setShowReplyForm] = useState(false);
   const [replyText, setReplyText] = useState('');
@@ -25,8 +26,8 @@ export default function NestedComment({ comment, onDelete, onEdit, onReply, leve
 
     try {
       setLoadingReplies(true);
-      const response = await api.get(`/comments/${commentId}/replies`);
-      setReplies(response.data);
+      const response = await api.get(`/comments/${commentId}/thread`);
+      setReplies(response.data.replies);
       setShowReplies(true);
     } catch (error) {
       console.error('Error loading replies:', error);
@@ -71,7 +71,7 @@ export default function PostDetail() {
         getPostComments(postId)
       ]);
       setPost(postData);
-      setComments(commentsData);
+      setComments(commentsData.comments);
     } catch (error) {
       console.error('Error loading post:', error);
     } finally {
@@ -23,7 +23,7 @@ const SharePostModal = ({ post, onClose, onShare }) => {
     setLoading(true);
     try {
       const followingData = await getFollowing(userProfile.id);
-      setFollowing(followingData || []);
+      setFollowing(followingData?.users || []);
     } catch (error) {
       console.error('Error loading following:', error);
       setFollowing([]);
@@ -1,7 +1,7 @@
 import { useState, useEffect, useRef } from 'react';
 import { X, ChevronLeft, ChevronRight, Eye, Trash2, Send } from 'lucide-react';
 import { useAuth } from '../context/AuthContext';
-import { markStoryViewed, getStoryViewers, deleteStory } from '../services/stories.service';
+import { getStory, markStoriesViewed, getStoryViewers, deleteStory } from '../services/stories.service';
 import { sendMessage } from '../services/messages.service';
 import { useNavigate } from 'react-router-dom';
 
@@ -13,26 +13,72 @@ export default function StoryViewer({ userStory, onClose, allStories, onNavigate
   const [isPaused, setIsPaused] = useState(false);
   const [showViewers, setShowViewers] = useState(false);
   const [viewers, setViewers] = useState([]);
+  const [viewersCursor, setViewersCursor] = useState(null);
   const [replyText, setReplyText] = useState('');
   const [isInputFocused, setIsInputFocused] = useState(false);
+  const [storyMedia, setStoryMedia] = useState({});
   const progressInterval = useRef(null);
   const videoRef = useRef(null);
+  // Views are sent in batches: queued here, flushed shortly after the last
+  // story opened and when the viewer closes
+  const pendingViews = useRef(new Set());
+  const sentViews = useRef(new Set());
+  const viewFlushTimer = useRef(null);
 
   const currentStory = userStory.stories[currentStoryIndex];
   const userId = userProfile?.id || userProfile?._id;
   const isOwnStory = userStory.author_id === userId;
   const STORY_DURATION = 5000; // 5 seconds
+  const VIEW_FLUSH_DELAY = 2000;
+  const VIEW_BATCH_SIZE = 20;
   
   // Get story ID safely
   const currentStoryId = currentStory?.id || currentStory?._id;
 
+  // Tray only carries previews; load the full media when a story is opened
+  const currentMediaUrl = currentStory?.media_url || storyMedia[currentStoryId] || currentStory?.thumbnail_url;
+
   useEffect(() => {
-    // Mark story as viewed
-    if (currentStoryId && !isOwnStory) {
-      markStoryViewed(currentStoryId);
+    if (!currentStoryId || currentStory?.media_url || storyMedia[currentStoryId]) return;
+
+    getStory(currentStoryId)
+      .then(story => setStoryMedia(prev => ({ ...prev, [currentStoryId]: story.media_url })))
+      .catch(error => console.error('Error loading story media:', error));
+  }, [currentStoryId]);
+
+  const flushViews = () => {
+    clearTimeout(viewFlushTimer.current);
+    viewFlushTimer.current = null;
+    if (pendingViews.current.size === 0) return;
+
+    const storyIds = [...pendingViews.current];
+    pendingViews.current.clear();
+    storyIds.forEach(id => sentViews.current.add(id));
+    markStoriesViewed(storyIds).catch(() => {
+      // Let a later flush retry them
+      storyIds.forEach(id => {
+        sentViews.current.delete(id);
+        pendingViews.current.add(id);
+      });
+    });
+  };
+
+  useEffect(() => {
+    // Queue the story as viewed
+    if (!currentStoryId || isOwnStory || sentViews.current.has(currentStoryId)) return;
+
+    pendingViews.current.add(currentStoryId);
+    if (pendingViews.current.size >= VIEW_BATCH_SIZE) {
+      flushViews();
+    } else {
+      clearTimeout(viewFlushTimer.current);
+      viewFlushTimer.current = setTimeout(flushViews, VIEW_FLUSH_DELAY);
     }
   }, [currentStoryId, isOwnStory]);
 
+  // Send whatever is queued when the viewer closes
+  useEffect(() => () => flushViews(), []);
+
   useEffect(() => {
     if (!isPaused && !isInputFocused) {
       startProgress();
@@ -105,7 +151,8 @@ export default function StoryViewer({ userStory, onClose, allStories, onNavigate
     
     try {
       const data = await getStoryViewers(currentStoryId);
-      setViewers(data);
+      setViewers(data.viewers);
+      setViewersCursor(data.next_cursor);
       setShowViewers(true);
     } catch (error) {
       console.error('Error loading viewers:', error);
@@ -113,6 +160,18 @@ export default function StoryViewer({ userStory, onClose, allStories, onNavigate
     }
   };
 
+  const loadMoreViewers = async () => {
+    if (!viewersCursor) return;
+
+    try {
+      const data = await getStoryViewers(currentStoryId, viewersCursor);
+      setViewers(prev => [...prev, ...data.viewers]);
+      setViewersCursor(data.next_cursor);
+    } catch (error) {
+      console.error('Error loading more viewers:', error);
+    }
+  };
+
   const handleDelete = async () => {
     if (!currentStoryId) return;
     if (!window.confirm('Delete this story?')) return;
@@ -268,7 +327,7 @@ export default function StoryViewer({ userStory, onClose, allStories, onNavigate
           {currentStory.media_type === 'video' ? (
             <video
               ref={videoRef}
-              src={currentStory.media_url}
+              src={currentMediaUrl}
               className="w-full h-full object-contain"
               autoPlay
               muted
@@ -278,7 +337,7 @@ export default function StoryViewer({ userStory, onClose, allStories, onNavigate
             />
           ) : (
             <img
-              src={currentStory.media_url}
+              src={currentMediaUrl}
               alt="Story"
               className="w-full h-full object-contain"
             />
@@ -381,6 +440,14 @@ export default function StoryViewer({ userStory, onClose, allStories, onNavigate
                     </p>
                   </div>
                 ))}
+                {viewersCursor && (
+                  <button
+                    onClick={loadMoreViewers}
+                    className="w-full py-2 text-sm font-bold text-slate-500 hover:text-slate-700"
+                  >
+                    Load more
+                  </button>
+                )}
               </div>
             )}
           </div>
@@ -35,8 +35,8 @@ const Notifications = () => {
 
   const loadFollowRequests = async () => {
     try {
-      const requests = await getPendingFollowRequests();
-      setFollowRequests(requests);
+      const page = await getPendingFollowRequests();
+      setFollowRequests(page.requests);
     } catch (error) {
       console.error('Error loading follow requests:', error);
     }
@@ -31,7 +31,7 @@ export default function PostDetail() {
       
       // Load comments
       const postComments = await getPostComments(postId);
-      setComments(postComments);
+      setComments(postComments.comments);
       
       // Check if user has liked this post
       if (currentUser && postData) {
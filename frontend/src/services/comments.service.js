@@ -11,10 +11,12 @@ export async function addComment(postId, userId, content) {
   }
 }
 
-// Get comments for a post
-export async function getPostComments(postId, limitCount = 50) {
+// Get a page of comments for a post ({ comments, has_more, next_cursor })
+export async function getPostComments(postId, limitCount = 50, cursor = null) {
   try {
-    const response = await api.get(`/comments/posts/${postId}?limit=${limitCount}`);
+    const response = await api.get(`/comments/posts/${postId}`, {
+      params: cursor ? { limit: limitCount, cursor } : { limit: limitCount }
+    });
     return response.data;
   } catch (error) {
     console.error('Error fetching comments:', error);
@@ -190,10 +190,12 @@ export async function addComment(postId, content) {
   }
 }
 
-// Get post comments
-export async function getPostComments(postId) {
+// Get a page of post comments ({ comments, has_more, next_cursor })
+export async function getPostComments(postId, cursor = null) {
   try {
-    const response = await api.get(`/comments/posts/${postId}`);
+    const response = await api.get(`/comments/posts/${postId}`, {
+      params: cursor ? { cursor } : {}
+    });
     return response.data;
   } catch (error) {
     console.error('Error fetching comments:', error);
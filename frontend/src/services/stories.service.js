@@ -48,10 +48,12 @@ export async function markStoryViewed(storyId) {
   }
 }
 
-// Get story viewers
-export async function getStoryViewers(storyId) {
+// Get one page of story viewers ({ viewers, has_more, next_cursor })
+export async function getStoryViewers(storyId, cursor = null) {
   try {
-    const response = await api.get(`/stories/${storyId}/viewers`);
+    const response = await api.get(`/stories/${storyId}/viewers`, {
+      params: cursor ? { cursor } : {}
+    });
     return response.data;
   } catch (error) {
     console.error('Error fetching story viewers:', error);
@@ -59,6 +61,17 @@ export async function getStoryViewers(storyId) {
   }
 }
 
+// Get story viewer count
+export async function getStoryViewerCount(storyId) {
+  try {
+    const response = await api.get(`/stories/${storyId}/viewers/count`);
+    return response.data;
+  } catch (error) {
+    console.error('Error fetching story viewer count:', error);
+    throw error;
+  }
+}
+
 // Delete a story
 export async function deleteStory(storyId) {
   try {
@@ -69,3 +82,14 @@ export async function deleteStory(storyId) {
     throw error;
   }
 }
+
+// Mark several stories as viewed in one request
+export async function markStoriesViewed(storyIds) {
+  try {
+    const response = await api.post('/stories/views', { story_ids: storyIds });
+    return response.data;
+  } catch (error) {
+    console.error('Error marking stories as viewed:', error);
+    throw error;
+  }
+}
@@ -58,10 +58,12 @@ export async function getFollowStatus(targetUserId) {
   }
 }
 
-// Get pending follow requests
-export async function getPendingFollowRequests() {
+// Get a page of pending follow requests ({ requests, has_more, next_cursor })
+export async function getPendingFollowRequests(cursor = null) {
   try {
-    const response = await api.get('/users/follow-requests/pending');
+    const response = await api.get('/users/follow-requests/pending', {
+      params: cursor ? { cursor } : {}
+    });
     return response.data;
   } catch (error) {
     console.error('Error fetching follow requests:', error);
@@ -91,6 +93,20 @@ export async function rejectFollowRequest(requestId) {
   }
 }
 
+// Accept or reject several follow requests at once (action: 'accept' | 'reject')
+export async function respondToFollowRequests(requestIds, action) {
+  try {
+    const response = await api.post('/users/follow-requests/bulk', {
+      request_ids: requestIds,
+      action
+    });
+    return response.data;
+  } catch (error) {
+    console.error('Error responding to follow requests:', error);
+    throw error;
+  }
+}
+
 // Get user's posts
 export async function getUserPosts(userId, limitCount = 20) {
   try {
@@ -124,13 +140,52 @@ export async function searchUsers(searchTerm, limitCount = 10) {
   }
 }
 
-// Get users that the current user is following
-export async function getFollowing(userId, limitCount = 50) {
+// Suggest users for @mentions (followed users first)
+export async function autocompleteMentions(prefix, limitCount = 8) {
+  try {
+    const response = await api.get('/users/mentions/autocomplete', {
+      params: { q: prefix, limit: limitCount }
+    });
+    return response.data;
+  } catch (error) {
+    console.error('Error fetching mention suggestions:', error);
+    throw error;
+  }
+}
+
+// Get a page of users that a user is following ({ users, has_more, next_cursor })
+export async function getFollowing(userId, limitCount = 50, cursor = null) {
   try {
-    const response = await api.get(`/users/${userId}/following-list?limit=${limitCount}`);
+    const response = await api.get(`/users/${userId}/following-list`, {
+      params: cursor ? { limit: limitCount, cursor } : { limit: limitCount }
+    });
     return response.data;
   } catch (error) {
     console.error('Error fetching following list:', error);
     throw error;
   }
+}
+
+// Get a page of a user's followers ({ users, has_more, next_cursor })
+export async function getFollowers(userId, limitCount = 50, cursor = null) {
+  try {
+    const response = await api.get(`/users/${userId}/followers-list`, {
+      params: cursor ? { limit: limitCount, cursor } : { limit: limitCount }
+    });
+    return response.data;
+  } catch (error) {
+    console.error('Error fetching followers list:', error);
+    throw error;
+  }
+}
+
+// Get "people you may know" suggestions for the current user
+export async function getSuggestedUsers(limitCount = 10) {
+  try {
+    const response = await api.get(`/users/suggestions?limit=${limitCount}`);
+    return response.data;
+  } catch (error) {
+    console.error('Error fetching suggested users:', error);
+    throw error;
+  }
 }
\ No newline at end of file